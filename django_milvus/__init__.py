@@ -2,4 +2,7 @@ from pymilvus import DataType
 
 from .connection import Connection
 from .fields import MilvusField
-from .utils import rebuild_index, update_entry
+from .managers import MilvusManager, MilvusQuerySet
+from .params import search_params
+from .registry import connections
+from .utils import aupdate_entry, delete_entry, rebuild_index, update_entry
@@ -0,0 +1,71 @@
+from typing import Any, Dict, List, Sequence
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from pymilvus import CollectionSchema
+
+# Short names of the bundled backends, for MILVUS["DATABASES"][dbname]["BACKEND"].
+BACKENDS = {
+    "milvus": "django_milvus.backends.milvus.MilvusBackend",
+    "numpy": "django_milvus.backends.memory.NumpyBackend",
+}
+DEFAULT_BACKEND = "milvus"
+
+
+class Backend:
+    """The server side of a Connection: where its collections live.
+
+    Collections are objects with the API of pymilvus.Collection, or rather
+    the part of it that Connection uses: name, partitions, has_partition(),
+    create_partition(), insert(), delete(), query(), search(), load(),
+    create_index(), drop() and the alias methods. The _async=True variants
+    may return results instead of futures, see await_milvus_future()."""
+
+    # Whether other processes see the same collections. Parallel inserts are
+    # only done by worker processes if they do.
+    shared = True
+
+    def __init__(self, dbname: str, config: Dict[str, Any]) -> None:
+        self.dbname = dbname
+        self.config = config
+
+    def connect(self) -> None:
+        raise NotImplementedError()
+
+    def disconnect(self) -> None:
+        raise NotImplementedError()
+
+    def forget(self) -> None:
+        """Drops the connection without closing it, in a forked child."""
+        raise NotImplementedError()
+
+    def is_healthy(self) -> bool:
+        raise NotImplementedError()
+
+    def has_collection(self, name: str) -> bool:
+        """Whether name is a collection or an alias."""
+        raise NotImplementedError()
+
+    def list_collections(self) -> List[str]:
+        """The names of the collections, without the aliases."""
+        raise NotImplementedError()
+
+    def get_collection(self, name: str) -> Any:
+        raise NotImplementedError()
+
+    def create_collection(
+        self, name: str, schema: CollectionSchema, shards_num: int
+    ) -> Any:
+        raise NotImplementedError()
+
+    def flush(self, names: Sequence[str]) -> None:
+        """Makes the inserts and deletes so far durable."""
+        raise NotImplementedError()
+
+
+def get_backend(dbname: str) -> Backend:
+    """Returns the backend of MILVUS["DATABASES"][dbname]["BACKEND"], one of
+    BACKENDS or the dotted path of a Backend subclass. Defaults to milvus."""
+    config = settings.MILVUS["DATABASES"][dbname]
+    name = config.get("BACKEND", DEFAULT_BACKEND)
+    return import_string(BACKENDS.get(name, name))(dbname, config)
@@ -0,0 +1,607 @@
+import ast
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from django.utils.functional import cached_property
+from pymilvus import CollectionSchema, DataType, FieldSchema
+
+from django_milvus.backends import Backend
+from django_milvus.pk import SUPPORTS_VARCHAR
+
+DEFAULT_PARTITION_NAME = "_default"
+# Searches compute the distances of this many (query, row) pairs at a time.
+SEARCH_CHUNK_SIZE = 1 << 24
+
+# The number of set bits of every byte.
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+SCALAR_DTYPES = {
+    DataType.BOOL: np.bool_,
+    DataType.INT8: np.int64,
+    DataType.INT16: np.int64,
+    DataType.INT32: np.int64,
+    DataType.INT64: np.int64,
+    DataType.FLOAT: np.float64,
+    DataType.DOUBLE: np.float64,
+}
+if SUPPORTS_VARCHAR:
+    SCALAR_DTYPES[DataType.VARCHAR] = object
+
+
+class NumpyBackend(Backend):
+    """Keeps the collections in the memory of the process and searches them
+    exactly, by brute force with numpy. No milvus server is needed, which
+    suits tests and development, and its results are the ground truth to
+    measure the recall of the milvus indexes against.
+
+        MILVUS = {"DATABASES": {"default": {"BACKEND": "numpy"}}}
+
+    Every Connection of the process with the same dbname sees the same
+    collections. With a "PATH" directory in the settings, the collections
+    are saved there on flush() and loaded from it when the process starts
+    using them. Other processes don't see the collections, so parallel
+    inserts are done in the calling process."""
+
+    shared = False
+
+    @cached_property
+    def database(self) -> "NumpyDatabase":
+        return get_database(self.dbname, self.config.get("PATH"))
+
+    def connect(self) -> None:
+        self.database
+
+    def disconnect(self) -> None:
+        pass
+
+    def forget(self) -> None:
+        pass
+
+    def is_healthy(self) -> bool:
+        return True
+
+    def has_collection(self, name: str) -> bool:
+        return self.database.has_collection(name)
+
+    def list_collections(self) -> List[str]:
+        return sorted(self.database.collections)
+
+    def get_collection(self, name: str) -> "NumpyCollection":
+        return self.database.get_collection(name)
+
+    def create_collection(
+        self, name: str, schema: CollectionSchema, shards_num: int
+    ) -> "NumpyCollection":
+        fields = [
+            NumpyField(f.name, f.dtype, (f.params or {}).get("dim"), bool(f.is_primary))
+            for f in schema.fields
+        ]
+        return self.database.create_collection(name, fields)
+
+    def flush(self, names: Sequence[str]) -> None:
+        self.database.save([self.database.resolve(name) for name in names])
+
+
+class NumpyField:
+    def __init__(
+        self, name: str, dtype: DataType, dim: Optional[int], is_primary: bool
+    ) -> None:
+        self.name = name
+        self.dtype = DataType(dtype)
+        self.dim = dim
+        self.is_primary = is_primary
+
+    @property
+    def is_vector(self) -> bool:
+        return self.dtype in (DataType.FLOAT_VECTOR, DataType.BINARY_VECTOR)
+
+    def to_array(self, values: Any) -> np.ndarray:
+        """Converts a column of insert data to its stored form: float32 or
+        packed uint8 rows for the vectors."""
+        if self.dtype == DataType.BINARY_VECTOR:
+            width = self.dim // 8  # type: ignore
+            packed = np.frombuffer(b"".join(map(bytes, values)), dtype=np.uint8)
+            return packed.reshape(-1, width)
+        if self.dtype == DataType.FLOAT_VECTOR:
+            return np.asarray(values, dtype=np.float32).reshape(-1, self.dim)
+        if SCALAR_DTYPES.get(self.dtype) is object:
+            return np.array([str(value) for value in values], dtype=object)
+        return np.asarray(values, dtype=SCALAR_DTYPES[self.dtype])
+
+    def to_schema(self) -> FieldSchema:
+        params = {} if self.dim is None else {"dim": self.dim}
+        return FieldSchema(self.name, self.dtype, is_primary=self.is_primary, **params)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "dtype": int(self.dtype),
+            "dim": self.dim,
+            "is_primary": self.is_primary,
+        }
+
+
+class NumpyPartition:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class NumpyCollection:
+    """A collection as columns of numpy arrays, plus the partition of each
+    row. Inserts are appended to a list of chunks, concatenated by the next
+    read, so that a bulk insert doesn't copy the collection every batch."""
+
+    def __init__(self, database: "NumpyDatabase", name: str, fields: List[NumpyField]):
+        self.database = database
+        self.name = name
+        self.fields = {f.name: f for f in fields}
+        self.primary_field = [f for f in fields if f.is_primary][0]
+        self.partition_names = [DEFAULT_PARTITION_NAME]
+        self.indexes: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.RLock()
+        self.columns = {f.name: f.to_array([]) for f in fields}
+        self.row_partitions = np.empty(0, dtype=np.int32)
+        self.chunks: List[Dict[str, np.ndarray]] = []
+        # The squared norms of the rows of the vector fields, for L2 searches.
+        self.norms: Dict[str, np.ndarray] = {}
+
+    @property
+    def schema(self) -> CollectionSchema:
+        return CollectionSchema([f.to_schema() for f in self.fields.values()])
+
+    @property
+    def partitions(self) -> List[NumpyPartition]:
+        return [NumpyPartition(name) for name in self.partition_names]
+
+    def has_partition(self, partition_name: str) -> bool:
+        return partition_name in self.partition_names
+
+    def create_partition(self, partition_name: str) -> None:
+        with self.lock:
+            if partition_name in self.partition_names:
+                raise ValueError(f"Partition {partition_name} exists already")
+            self.partition_names.append(partition_name)
+
+    @property
+    def num_entities(self) -> int:
+        return len(self.get_columns()[0][self.primary_field.name])
+
+    def insert(
+        self,
+        data: Sequence[Any],
+        partition_name: Optional[str] = None,
+        _async: bool = False,
+    ) -> None:
+        """data holds one column per field, in the order of the schema."""
+        partition_name = partition_name or DEFAULT_PARTITION_NAME
+        with self.lock:
+            if partition_name not in self.partition_names:
+                raise ValueError(f"Partition {partition_name} doesn't exist")
+            if len(data) != len(self.fields):
+                raise ValueError(f"Expected {len(self.fields)} columns")
+            chunk = {
+                f.name: f.to_array(column)
+                for f, column in zip(self.fields.values(), data)
+            }
+            lengths = set(len(column) for column in chunk.values())
+            if len(lengths) != 1:
+                raise ValueError("Expected columns of equal length")
+            chunk[""] = np.full(
+                lengths.pop(), self.partition_names.index(partition_name), np.int32
+            )
+            self.chunks.append(chunk)
+
+    def get_columns(self) -> Any:
+        """Returns the columns and the partition column, with the pending
+        chunks concatenated."""
+        with self.lock:
+            if self.chunks:
+                chunks, self.chunks = self.chunks, []
+                for name in self.fields:
+                    self.columns[name] = np.concatenate(
+                        [self.columns[name]] + [chunk[name] for chunk in chunks]
+                    )
+                self.row_partitions = np.concatenate(
+                    [self.row_partitions] + [chunk[""] for chunk in chunks]
+                )
+                self.norms = {}
+            return self.columns, self.row_partitions
+
+    def get_norms(self, field_name: str) -> np.ndarray:
+        with self.lock:
+            columns, _ = self.get_columns()
+            if field_name not in self.norms:
+                self.norms[field_name] = get_squared_norms(columns[field_name])
+            return self.norms[field_name]
+
+    def delete(self, expr: str, _async: bool = False) -> None:
+        with self.lock:
+            columns, row_partitions = self.get_columns()
+            keep = ~evaluate_expr(expr, columns)
+            self.columns = {name: column[keep] for name, column in columns.items()}
+            self.row_partitions = row_partitions[keep]
+            self.norms = {}
+
+    def get_mask(
+        self, expr: Optional[str], partition_names: Optional[Sequence[str]]
+    ) -> np.ndarray:
+        columns, row_partitions = self.get_columns()
+        mask = np.ones(len(row_partitions), dtype=bool)
+        if partition_names is not None:
+            indexes = [
+                i
+                for i, name in enumerate(self.partition_names)
+                if name in partition_names
+            ]
+            mask &= np.isin(row_partitions, indexes)
+        if expr:
+            mask &= evaluate_expr(expr, columns)
+        return mask
+
+    def query(
+        self,
+        expr: str,
+        output_fields: Optional[Sequence[str]] = None,
+        partition_names: Optional[Sequence[str]] = None,
+        **kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        with self.lock:
+            columns, _ = self.get_columns()
+            rows = np.flatnonzero(self.get_mask(expr, partition_names))
+        names = [self.primary_field.name] + [
+            name for name in output_fields or () if name != self.primary_field.name
+        ]
+        values = [columns[name][rows].tolist() for name in names]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    def search(
+        self,
+        data: Sequence[Any],
+        anns_field: str,
+        param: Dict[str, Any],
+        limit: int,
+        expr: Optional[str] = None,
+        partition_names: Optional[Sequence[str]] = None,
+        output_fields: Optional[Sequence[str]] = None,
+        _async: bool = False,
+        **kwargs: Any,
+    ) -> List["NumpyHits"]:
+        """Exact search: the distance to every row matching expr and the
+        partitions is computed, and the limit nearest are kept with
+        argpartition. The vectors are only copied when some rows are
+        filtered out."""
+        metric = param.get("metric_type", "L2")
+        with self.lock:
+            columns, _ = self.get_columns()
+            mask = self.get_mask(expr, partition_names)
+            norms = self.get_norms(anns_field) if metric == "L2" else None
+        vectors = columns[anns_field]
+        rows: Optional[np.ndarray] = None
+        if not mask.all():
+            rows = np.flatnonzero(mask)
+            vectors = vectors[rows]
+            norms = None if norms is None else norms[rows]
+        queries = self.fields[anns_field].to_array(data)
+        limit = min(limit, len(vectors))
+        step = max(1, SEARCH_CHUNK_SIZE // max(1, len(vectors) * vectors.shape[1]))
+        results = []
+        for start in range(0, len(queries), step):
+            distances = get_distances(
+                metric, queries[start : start + step], vectors, norms
+            )
+            # The largest inner products are the nearest.
+            order = -distances if metric == "IP" else distances
+            for query_order, query_distances in zip(order, distances):
+                nearest = select_nearest(query_order, limit)
+                index = nearest if rows is None else rows[nearest]
+                results.append(
+                    NumpyHits(
+                        columns[self.primary_field.name][index],
+                        query_distances[nearest],
+                        {name: columns[name][index] for name in output_fields or ()},
+                    )
+                )
+        return results
+
+    def load(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def release(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def create_index(self, field_name: str, index_params: Dict[str, Any]) -> None:
+        """Searches are exact, the params are only kept."""
+        self.indexes[field_name] = index_params
+
+    def drop(self) -> None:
+        self.database.drop_collection(self.name)
+
+    def create_alias(self, alias: str) -> None:
+        self.database.set_alias(alias, self.name, create=True)
+
+    def alter_alias(self, alias: str) -> None:
+        self.database.set_alias(alias, self.name, create=False)
+
+    def drop_alias(self, alias: str) -> None:
+        self.database.drop_alias(alias)
+
+
+class NumpyHit:
+    def __init__(self, id: Any, distance: float, entity: Dict[str, Any]) -> None:
+        self.id = id
+        self.distance = distance
+        self.entity = entity
+
+
+class NumpyHits:
+    """The hits of one query vector, nearest first, like pymilvus' Hits."""
+
+    def __init__(
+        self, ids: np.ndarray, distances: np.ndarray, outputs: Dict[str, np.ndarray]
+    ) -> None:
+        self.ids = ids.tolist()
+        self.distances = distances.tolist()
+        values = {name: column.tolist() for name, column in outputs.items()}
+        self.entities = [
+            {name: column[i] for name, column in values.items()}
+            for i in range(len(self.ids))
+        ]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[NumpyHit]:
+        for hit in zip(self.ids, self.distances, self.entities):
+            yield NumpyHit(*hit)
+
+
+def select_nearest(order: np.ndarray, limit: int) -> np.ndarray:
+    """Returns the indexes of the limit lowest values of order, sorted."""
+    if limit <= 0:
+        return np.empty(0, dtype=np.int64)
+    if limit < len(order):
+        candidates = np.argpartition(order, limit - 1)[:limit]
+    else:
+        candidates = np.arange(len(order))
+    return candidates[np.argsort(order[candidates], kind="stable")]
+
+
+def get_squared_norms(vectors: np.ndarray) -> np.ndarray:
+    return np.einsum("ij,ij->i", vectors, vectors)
+
+
+def get_distances(
+    metric: str,
+    queries: np.ndarray,
+    vectors: np.ndarray,
+    norms: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Returns the (len(queries), len(vectors)) distances, as milvus reports
+    them: squared euclidean for L2, and -log2 of the jaccard similarity for
+    TANIMOTO. norms are the squared norms of vectors, computed if None. Float
+    vectors are compared in float32, as milvus does, without copies."""
+    if metric == "L2":
+        if norms is None:
+            norms = get_squared_norms(vectors)
+        distances = queries @ vectors.T
+        distances *= -2
+        distances += get_squared_norms(queries)[:, None]
+        distances += norms[None, :]
+        # Rounding can make the distance of equal vectors slightly negative.
+        return np.maximum(distances, 0, out=distances)
+    if metric == "IP":
+        return queries @ vectors.T
+    if metric in ("HAMMING", "JACCARD", "TANIMOTO"):
+        both = POPCOUNT[queries[:, None, :] & vectors[None, :, :]].sum(axis=2)
+        either = POPCOUNT[queries[:, None, :] | vectors[None, :, :]].sum(axis=2)
+        if metric == "HAMMING":
+            return (either - both).astype(np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = np.where(either > 0, both / np.maximum(either, 1), 1.0)
+        if metric == "JACCARD":
+            return (1 - similarity).astype(np.float32)
+        with np.errstate(divide="ignore"):
+            return (-np.log2(similarity)).astype(np.float32)
+    raise ValueError(f"Unsupported metric: {metric}")
+
+
+COMPARE_OPS = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+}
+
+
+def evaluate_expr(expr: str, columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """Evaluates a milvus boolean expression over the columns, returns the
+    mask of the matching rows. Supports comparisons, in and not in lists,
+    and, or, not, and the true/false literals: the expressions that
+    Connection and django_milvus.filters generate."""
+    count = len(next(iter(columns.values())))
+    expr = expr.replace("&&", " and ").replace("||", " or ")
+    tree = ast.parse(expr.strip(), mode="eval").body
+    return np.broadcast_to(evaluate_node(tree, columns), (count,)).copy()
+
+
+def evaluate_node(node: ast.AST, columns: Dict[str, np.ndarray]) -> Any:
+    if isinstance(node, ast.BoolOp):
+        values = [evaluate_node(value, columns) for value in node.values]
+        reduce = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return reduce.reduce(values)
+    if isinstance(node, ast.UnaryOp):
+        value = evaluate_node(node.operand, columns)
+        if isinstance(node.op, ast.Not):
+            return np.logical_not(value)
+        if isinstance(node.op, ast.USub):
+            return -value
+        raise ValueError(f"Unsupported operator: {ast.dump(node.op)}")
+    if isinstance(node, ast.Compare):
+        result: Any = True
+        left = evaluate_node(node.left, columns)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = evaluate_node(comparator, columns)
+            if isinstance(op, (ast.In, ast.NotIn)):
+                found = np.isin(left, np.asarray(right, dtype=np.asarray(left).dtype))
+                matches = found if isinstance(op, ast.In) else ~found
+            else:
+                matches = COMPARE_OPS[type(op)](left, right)
+            result = np.logical_and(result, matches)
+            left = right
+        return result
+    if isinstance(node, ast.Name):
+        if node.id in ("true", "false"):
+            return node.id == "true"
+        if node.id not in columns:
+            raise ValueError(f"Unknown field in expression: {node.id}")
+        return columns[node.id]
+    if isinstance(node, ast.List):
+        return [evaluate_node(element, columns) for element in node.elts]
+    if isinstance(node, ast.Constant):
+        return node.value
+    raise ValueError(f"Unsupported expression: {ast.dump(node)}")
+
+
+class NumpyDatabase:
+    """The collections and aliases of a dbname, optionally saved in a
+    directory: one {name}.npz file per collection and an aliases.json."""
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self.lock = threading.RLock()
+        self.collections: Dict[str, NumpyCollection] = {}
+        self.aliases: Dict[str, str] = {}
+        if path is not None:
+            self.load()
+
+    def resolve(self, name: str) -> str:
+        return self.aliases.get(name, name)
+
+    def has_collection(self, name: str) -> bool:
+        return self.resolve(name) in self.collections
+
+    def get_collection(self, name: str) -> NumpyCollection:
+        try:
+            return self.collections[self.resolve(name)]
+        except KeyError:
+            raise ValueError(f"Collection {name} doesn't exist")
+
+    def create_collection(self, name: str, fields: List[NumpyField]) -> NumpyCollection:
+        with self.lock:
+            if self.has_collection(name):
+                raise ValueError(f"Collection {name} exists already")
+            collection = NumpyCollection(self, name, fields)
+            self.collections[name] = collection
+            return collection
+
+    def drop_collection(self, name: str) -> None:
+        with self.lock:
+            self.collections.pop(name, None)
+            self.aliases = {a: n for a, n in self.aliases.items() if n != name}
+            if self.path is not None:
+                file = os.path.join(self.path, f"{name}.npz")
+                if os.path.exists(file):
+                    os.remove(file)
+                self.save_aliases()
+
+    def set_alias(self, alias: str, name: str, create: bool) -> None:
+        with self.lock:
+            if create and (alias in self.aliases or alias in self.collections):
+                raise ValueError(f"{alias} exists already")
+            if not create and alias not in self.aliases:
+                raise ValueError(f"Alias {alias} doesn't exist")
+            self.aliases[alias] = name
+            if self.path is not None:
+                self.save_aliases()
+
+    def drop_alias(self, alias: str) -> None:
+        with self.lock:
+            self.aliases.pop(alias, None)
+            if self.path is not None:
+                self.save_aliases()
+
+    def save(self, names: Sequence[str]) -> None:
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        for name in names:
+            collection = self.collections.get(name)
+            if collection is None:
+                continue
+            with collection.lock:
+                columns, row_partitions = collection.get_columns()
+                meta = {
+                    "fields": [f.to_dict() for f in collection.fields.values()],
+                    "partitions": collection.partition_names,
+                    "indexes": collection.indexes,
+                }
+                arrays = {
+                    # Strings are saved as unicode arrays, not pickled.
+                    f"column_{name}": column.astype(str)
+                    if column.dtype == object
+                    else column
+                    for name, column in columns.items()
+                }
+                path = os.path.join(self.path, f"{name}.npz")
+                with open(path + ".tmp", "wb") as file:
+                    np.savez(
+                        file,
+                        meta=np.array(json.dumps(meta)),
+                        partitions=row_partitions,
+                        **arrays,
+                    )
+                os.replace(path + ".tmp", path)
+        self.save_aliases()
+
+    def save_aliases(self) -> None:
+        os.makedirs(self.path, exist_ok=True)  # type: ignore
+        with open(os.path.join(self.path, "aliases.json"), "w") as file:  # type: ignore
+            json.dump(self.aliases, file)
+
+    def load(self) -> None:
+        if not os.path.isdir(self.path):  # type: ignore
+            return
+        for entry in sorted(os.listdir(self.path)):  # type: ignore
+            if not entry.endswith(".npz"):
+                continue
+            with np.load(os.path.join(self.path, entry)) as data:  # type: ignore
+                meta = json.loads(str(data["meta"]))
+                fields = [NumpyField(**f) for f in meta["fields"]]
+                collection = NumpyCollection(self, entry[: -len(".npz")], fields)
+                collection.partition_names = meta["partitions"]
+                collection.indexes = meta["indexes"]
+                for f in fields:
+                    column = data[f"column_{f.name}"]
+                    if SCALAR_DTYPES.get(f.dtype) is object:
+                        column = column.astype(object)
+                    collection.columns[f.name] = column
+                collection.row_partitions = data["partitions"]
+            self.collections[collection.name] = collection
+        aliases = os.path.join(self.path, "aliases.json")  # type: ignore
+        if os.path.exists(aliases):
+            with open(aliases) as file:
+                self.aliases = json.load(file)
+
+
+_databases: Dict[str, NumpyDatabase] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(dbname: str, path: Optional[str] = None) -> NumpyDatabase:
+    """Returns the collections of dbname, shared by the process."""
+    with _databases_lock:
+        database = _databases.get(dbname)
+        if database is None:
+            database = _databases[dbname] = NumpyDatabase(path)
+        return database
+
+
+def reset_databases() -> None:
+    """Forgets every in-memory collection, for tests."""
+    with _databases_lock:
+        _databases.clear()
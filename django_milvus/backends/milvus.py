@@ -0,0 +1,62 @@
+from typing import List, Sequence
+
+import pymilvus
+from pymilvus import Collection, CollectionSchema
+
+from django_milvus.backends import Backend
+
+
+class MilvusBackend(Backend):
+    """A milvus server, at the HOST and PORT of the database settings."""
+
+    def connect(self) -> None:
+        pymilvus.connections.connect(
+            self.dbname, host=self.config["HOST"], port=str(self.config["PORT"])
+        )
+
+    def disconnect(self) -> None:
+        try:
+            pymilvus.connections.disconnect(self.dbname)
+        except Exception:
+            # The channel is being replaced because it is broken already.
+            pass
+
+    def forget(self) -> None:
+        """Drops the pymilvus handler of this alias without closing it, the
+        channel still belongs to the parent process."""
+        for attr in ("_conns", "_connected_alias"):
+            handlers = getattr(pymilvus.connections, attr, None)
+            if isinstance(handlers, dict):
+                handlers.pop(self.dbname, None)
+
+    def is_healthy(self) -> bool:
+        try:
+            self.list_collections()
+        except Exception:
+            return False
+        return True
+
+    def has_collection(self, name: str) -> bool:
+        return pymilvus.utility.has_collection(name, using=self.dbname)
+
+    def list_collections(self) -> List[str]:
+        return pymilvus.utility.list_collections(using=self.dbname)
+
+    def get_collection(self, name: str) -> Collection:
+        # Costs a describe_collection RPC, Connection caches the handles.
+        return Collection(name=name, using=self.dbname)
+
+    def create_collection(
+        self, name: str, schema: CollectionSchema, shards_num: int
+    ) -> Collection:
+        return Collection(
+            name=name, schema=schema, using=self.dbname, shards_num=shards_num
+        )
+
+    def flush(self, names: Sequence[str]) -> None:
+        if hasattr(Collection, "flush"):
+            # pymilvus 2.2 or later.
+            for name in names:
+                self.get_collection(name).flush()
+        else:
+            pymilvus.connections.get_connection(self.dbname).flush(list(names))
@@ -0,0 +1,184 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+
+DEFAULT_TTL = 60.0
+DEFAULT_MAX_SIZE = 10000
+# Vectors are rounded to this precision before hashing, so that the same
+# vector going through float32 and back still hits the cache.
+DEFAULT_QUANTIZE = 1e-4
+
+SearchResult = Tuple[List[Any], List[float]]
+
+
+class SearchCache:
+    """Caches the result of searching one vector. Configured with
+    MILVUS["SEARCH_CACHE"], for example:
+
+        "SEARCH_CACHE": {
+            "BACKEND": "lru",  # or "django" to use django's cache framework
+            "TTL": 60,  # seconds
+            "MAX_SIZE": 10000,  # lru only
+            "CACHE": "default",  # django only, the name in settings.CACHES
+            "QUANTIZE": 1e-4,
+        }
+
+    Each collection has a generation that is part of the keys. Writing to the
+    collection replaces the generation, so the results cached until then are
+    never read again and expire on their own. With the lru backend this
+    only invalidates the current process, use the django backend with a shared
+    cache when several processes write to milvus.
+    """
+
+    def __init__(self, options: Dict[str, Any]) -> None:
+        self.ttl = float(options.get("TTL", DEFAULT_TTL))
+        self.quantize = float(options.get("QUANTIZE", DEFAULT_QUANTIZE))
+
+    def get_keys(
+        self, dbname: str, collection_name: str, kwargs: Dict[str, Any]
+    ) -> List[str]:
+        """Returns the key of every vector in kwargs["data"]. Everything else
+        in the search kwargs (field, limit, params...) is part of the keys."""
+        generation = self.get_generation(dbname, collection_name)
+        options = {k: v for k, v in kwargs.items() if k != "data"}
+        digest = hashlib.blake2b(repr(sorted(options.items())).encode(), digest_size=16)
+        prefix = f"django_milvus:search:{dbname}:{collection_name}:{generation}"
+        keys = []
+        for vector in kwargs["data"]:
+            key = digest.copy()
+            key.update(self.quantize_vector(vector))
+            keys.append(f"{prefix}:{key.hexdigest()}")
+        return keys
+
+    def quantize_vector(self, vector: Any) -> bytes:
+        if isinstance(vector, bytes):
+            return vector
+        values = np.asarray(vector, dtype=np.float64) / self.quantize
+        return np.rint(values).astype(np.int64).tobytes()
+
+    def get_generation_key(self, dbname: str, collection_name: str) -> str:
+        return f"django_milvus:generation:{dbname}:{collection_name}"
+
+    def get_generation(self, dbname: str, collection_name: str) -> int:
+        raise NotImplementedError()
+
+    def invalidate(self, dbname: str, collection_name: str) -> None:
+        raise NotImplementedError()
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[SearchResult]]:
+        raise NotImplementedError()
+
+    def set_many(self, items: Dict[str, SearchResult]) -> None:
+        raise NotImplementedError()
+
+
+class LRUSearchCache(SearchCache):
+    def __init__(self, options: Dict[str, Any]) -> None:
+        super().__init__(options)
+        self.max_size = int(options.get("MAX_SIZE", DEFAULT_MAX_SIZE))
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, Tuple[float, SearchResult]]" = OrderedDict()
+        self.generations: Dict[str, int] = {}
+
+    def get_generation(self, dbname: str, collection_name: str) -> int:
+        return self.generations.get(self.get_generation_key(dbname, collection_name), 0)
+
+    def invalidate(self, dbname: str, collection_name: str) -> None:
+        key = self.get_generation_key(dbname, collection_name)
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[SearchResult]]:
+        now = time.monotonic()
+        values: List[Optional[SearchResult]] = []
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    values.append(None)
+                elif entry[0] < now:
+                    del self.entries[key]
+                    values.append(None)
+                else:
+                    self.entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def set_many(self, items: Dict[str, SearchResult]) -> None:
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            for key, value in items.items():
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+class DjangoSearchCache(SearchCache):
+    def __init__(self, options: Dict[str, Any]) -> None:
+        super().__init__(options)
+        self.cache = caches[options.get("CACHE", "default")]
+
+    def get_generation(self, dbname: str, collection_name: str) -> int:
+        key = self.get_generation_key(dbname, collection_name)
+        generation = self.cache.get(key)
+        if generation is None:
+            self.cache.add(key, time.time_ns(), None)
+            generation = self.cache.get(key)
+        return generation
+
+    def invalidate(self, dbname: str, collection_name: str) -> None:
+        # Not a counter: if the generation is evicted, a counter could start
+        # over and make stale results reachable again.
+        key = self.get_generation_key(dbname, collection_name)
+        self.cache.set(key, time.time_ns(), None)
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[SearchResult]]:
+        found = self.cache.get_many(keys)
+        return [found.get(key) for key in keys]
+
+    def set_many(self, items: Dict[str, SearchResult]) -> None:
+        self.cache.set_many(items, self.ttl)
+
+
+SEARCH_CACHE_BACKENDS = {
+    "lru": LRUSearchCache,
+    "django": DjangoSearchCache,
+}
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_loaded = False
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """Returns the configured search cache, or None if MILVUS["SEARCH_CACHE"]
+    is not set."""
+    global _search_cache, _search_cache_loaded
+    if not _search_cache_loaded:
+        options = settings.MILVUS.get("SEARCH_CACHE")
+        if options:
+            backend = options.get("BACKEND", "lru")
+            if backend not in SEARCH_CACHE_BACKENDS:
+                raise ValueError(f"Unknown search cache backend: {backend}")
+            _search_cache = SEARCH_CACHE_BACKENDS[backend](options)
+        else:
+            _search_cache = None
+        _search_cache_loaded = True
+    return _search_cache
+
+
+def reset_search_cache(**kwargs: Any) -> None:
+    global _search_cache, _search_cache_loaded
+    if kwargs.get("setting", "MILVUS") == "MILVUS":
+        _search_cache = None
+        _search_cache_loaded = False
+
+
+setting_changed.connect(reset_search_cache)
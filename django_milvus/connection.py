@@ -1,55 +1,165 @@
-from typing import Any, List, Type, TypeVar
-from uuid import UUID
+import logging
+import math
+import time
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Type
 
-import pymilvus
+import numpy as np
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.db.models import Model
 from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
 from pymilvus import Collection, CollectionSchema, DataType, FieldSchema
 
+from django_milvus.backends import Backend, get_backend
+from django_milvus.cache import SearchResult, get_search_cache
 from django_milvus.fields import MilvusField
+from django_milvus.filters import (
+    get_filter_expr,
+    get_filtered_partition_names,
+    get_search_database,
+    get_sql_filters,
+)
+from django_milvus.fingerprint import get_fingerprints, get_label_fingerprints
+from django_milvus.futures import await_milvus_future, run_blocking
+from django_milvus.options import get_milvus_options
+from django_milvus.params import add_search_rounds, get_search_params
+from django_milvus.validation import is_data_error, is_retryable_error, reject_rows
 
-Int64 = int
-Int128 = int
+logger = logging.getLogger("django_milvus")
+
+DEFAULT_BATCH_SIZE = 10000
+# Deletes are sent as "id in [...]" expressions, keep them reasonably short.
+DEFAULT_DELETE_BATCH_SIZE = 1000
+# Number of query vectors (nq) sent per search request.
+DEFAULT_SEARCH_BATCH_SIZE = 1024
+DEFAULT_SHARDS_NUM = 2
+# The largest limit (topk) milvus accepts.
+MAX_SEARCH_LIMIT = 16384
+# Adaptive searches multiply their limit by this much each round.
+ADAPTIVE_GROWTH = 4
+
+# A hash of the vectors of each row, see sync_collection().
+FINGERPRINT_FIELD_NAME = "django_fingerprint"
 
 
 class Connection:
     def __init__(self, dbname: str):
         self.dbname = dbname
+        # Collection handles by name, and the names known to be loaded. The
+        # registry keeps one Connection per process, so this is a per process
+        # cache. See get_collection() and load_collection().
+        self.collections: Dict[str, Collection] = {}
+        self.loaded_collections: Set[str] = set()
+        # Partition names by collection name, see get_partition_names().
+        self.partitions: Dict[str, Set[str]] = {}
+
+    @cached_property
+    def backend(self) -> Backend:
+        """Where the collections are, see django_milvus.backends."""
+        return get_backend(self.dbname)
 
     def connect(self):
-        MILVUS = settings.MILVUS
-        config = MILVUS["DATABASES"][self.dbname]
-        HOST = config["HOST"]
-        PORT = config["PORT"]
-        pymilvus.connections.connect(self.dbname, host=HOST, port=str(PORT))
+        self.backend.connect()
 
-    def has_collection(self, model: Type[Model]) -> Collection:
-        return pymilvus.utility.get_connection().has_collection(
-            self.get_collection_name(model)
-        )
+    async def aconnect(self) -> None:
+        # The handshake is done once per process, a thread is fine for that.
+        await run_blocking(self.connect)
+
+    def disconnect(self) -> None:
+        self.backend.disconnect()
+
+    def forget(self) -> None:
+        """Drops the connection of this alias without closing it. Used in a
+        forked child, where the channel still belongs to the parent."""
+        self.backend.forget()
+
+    def is_healthy(self) -> bool:
+        return self.backend.is_healthy()
+
+    def has_collection(self, model: Type[Model]) -> bool:
+        return self.backend.has_collection(self.get_collection_name(model))
+
+    def get_collection(self, model: Type[Model]) -> Collection:
+        """Returns a cached collection handle. Creating a pymilvus.Collection
+        costs a describe_collection RPC, so it is only done once."""
+        return self.get_collection_by_name(self.get_collection_name(model))
+
+    def get_collection_by_name(self, name: str) -> Collection:
+        collection = self.collections.get(name)
+        if collection is None:
+            collection = self.backend.get_collection(name)
+            self.collections[name] = collection
+        return collection
+
+    def load_collection(self, model: Type[Model]) -> Collection:
+        """Returns the collection, ready for searching. load() is only called
+        the first time, or again after invalidate_collection()."""
+        collection = self.get_collection(model)
+        if collection.name not in self.loaded_collections:
+            collection.load()
+            self.loaded_collections.add(collection.name)
+        return collection
+
+    async def aget_collection(self, model: Type[Model]) -> Collection:
+        collection = self.collections.get(self.get_collection_name(model))
+        if collection is None:
+            collection = await run_blocking(self.get_collection, model)
+        return collection
+
+    async def aload_collection(self, model: Type[Model]) -> Collection:
+        name = self.get_collection_name(model)
+        if name in self.loaded_collections:
+            return self.collections[name]
+        return await run_blocking(self.load_collection, model)
 
-    def get_collection(self, model: Type[Model]) -> pymilvus.Collection:
-        return pymilvus.Collection(name=self.get_collection_name(model))
+    def invalidate_collection(self, model: Type[Model]) -> None:
+        """Forgets the cached handle and load state of the model's collection.
+        Needed when the collection was dropped or recreated, possibly by
+        another process."""
+        name = self.get_collection_name(model)
+        self.collections.pop(name, None)
+        self.loaded_collections.discard(name)
+        self.partitions.pop(name, None)
+        self.invalidate_search_cache(model)
+
+    def invalidate_search_cache(self, model: Type[Model]) -> None:
+        """Called after every write to the model's collection."""
+        cache = get_search_cache()
+        if cache is not None:
+            cache.invalidate(self.dbname, self.get_collection_name(model))
 
     def get_collection_name(self, model: Type[Model]) -> str:
+        """The name every read and write goes through. It is either a
+        collection, or an alias of the current version of the collection once
+        it has been rebuilt with rebuild_collection()."""
         return model.__name__.lower()
 
-    def create_collection(self, model: Type[Model]) -> Collection:
+    def create_collection(
+        self, model: Type[Model], name: Optional[str] = None
+    ) -> Collection:
         model_name = model.__name__.lower()
         schema = CollectionSchema(
             fields=self.get_milvus_field_schemas(model),
             description=f"collection for {model_name}",
         )
-        collection = Collection(
-            name=self.get_collection_name(model),
-            schema=schema,
-            using=self.dbname,
-            shards_num=2,
+        collection = self.backend.create_collection(
+            name or self.get_collection_name(model), schema, self.get_shards_num()
         )
         self.build_indexes(model, collection)
+        if name is None:
+            self.invalidate_collection(model)
+        self.collections[collection.name] = collection
         return collection
 
+    def get_shards_num(self) -> int:
+        """MILVUS["DATABASES"][dbname]["SHARDS_NUM"], the number of shards of
+        the collections created from now on. Inserts are spread over the
+        shards, more of them allow more concurrent inserts."""
+        config = settings.MILVUS["DATABASES"][self.dbname]
+        return int(config.get("SHARDS_NUM", DEFAULT_SHARDS_NUM))
+
     def build_indexes(self, model: Type[Model], collection: Collection) -> None:
         for field in self.get_sorted_model_fields(model):
             collection.create_index(
@@ -57,12 +167,87 @@ class Connection:
                 index_params={
                     "metric_type": field.metric_type,
                     "index_type": field.index_type,
-                    "params": {"nlist": field.nlist},
+                    "params": field.get_index_params(),
                 },
             )
 
     def remove_collection(self, model: Type[Model]) -> None:
-        self.get_collection(model).drop()
+        versions = self.list_collection_versions(model)
+        if self.is_alias(model):
+            # The collection the alias points at, whichever version it is.
+            self.get_collection(model).drop_alias(self.get_collection_name(model))
+        else:
+            self.get_collection(model).drop()
+        self.drop_collections(versions)
+        self.invalidate_collection(model)
+
+    def drop_collections(self, names: Sequence[str]) -> None:
+        for name in names:
+            self.get_collection_by_name(name).drop()
+            self.collections.pop(name, None)
+            self.loaded_collections.discard(name)
+            self.partitions.pop(name, None)
+
+    def is_alias(self, model: Type[Model]) -> bool:
+        return (
+            self.has_collection(model)
+            and self.get_collection_name(model) not in self.backend.list_collections()
+        )
+
+    def list_collection_versions(self, model: Type[Model]) -> List[str]:
+        """Returns the names of the versions of the model's collection created
+        by rebuild_collection(), oldest first."""
+        prefix = f"{self.get_collection_name(model)}_v"
+        versions = [
+            name
+            for name in self.backend.list_collections()
+            if name.startswith(prefix) and name[len(prefix) :].isdigit()
+        ]
+        versions.sort(key=lambda name: int(name[len(prefix) :]))
+        return versions
+
+    def rebuild_collection(
+        self,
+        queryset: QuerySet,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: int = 1,
+    ) -> int:
+        """Rebuilds the collection without downtime. A new version named
+        {name}_v{timestamp} is created, filled, indexed and loaded while
+        searches keep using the current one, then the alias is pointed at it
+        and the previous versions are dropped. Returns the number of inserted
+        rows.
+
+        Rows saved while the new version is filled are written to the current
+        one: once the alias points at the new version, a sync_collection()
+        pass inserts them into it too. Until that pass completes, searches
+        may miss those changes.
+
+        A collection created by create_collection() under the name itself is
+        dropped right before the alias is created, the alias can't be created
+        while it exists. That only happens the first time, and searches fail
+        in between."""
+        model = queryset.model
+        current_name = self.get_collection_name(model)
+        name = f"{current_name}_v{time.time_ns() // 1000}"
+        collection = self.create_collection(model, name=name)
+        count = self.bulk_insert_entries(
+            queryset, batch_size=batch_size, collection_name=name, workers=workers
+        )
+        self.backend.flush([name])
+        collection.load()
+        if self.is_alias(model):
+            collection.alter_alias(current_name)
+        else:
+            if self.has_collection(model):
+                self.drop_collections([current_name])
+            collection.create_alias(current_name)
+        self.invalidate_collection(model)
+        count += self.sync_collection(queryset, batch_size=batch_size)["inserted"]
+        self.drop_collections(
+            [v for v in self.list_collection_versions(model) if v != name]
+        )
+        return count
 
     def get_sorted_model_fields(self, model: Type[Model]) -> List[MilvusField]:
         fields = [
@@ -76,134 +261,903 @@ class Connection:
     def get_milvus_field_schemas(self, model: Type[Model]) -> List[FieldSchema]:
         """
         We are using this layout: [
-            id: int64,
-            django_pk_high: int8, (this is final 2 bits)
-            django_pk_mid: int64, (this is the next 63 bits)
-            django_pk_low: int64, (this is the first 63 bits)
+            id: the milvus primary key,
+            ...the extra pk columns of the pk strategy,
+            django_fingerprint: int64, (a hash of the vectors of the row)
+        ] followed by the mirror fields of MilvusMeta, in declaration order [
+            django_field_name: scalar_field,
         ] followed by sorted [
             django_field_name: vector_field,
             for each declared MilvusField on the Django model.
         ]
 
-        This workaround is because milvus doesn't support the String data type yet,
-        and we need a way to store the UUID primary key, which is 128 bits.
-
-
-        The uuid is ((django_pk_high & mask_high) << 126) + ((django_pk_mid & mask_mid) << 63) + (django_pk_low & mask_low)
-        mask_high is 0b11
-        mask_mid and mask_low are (1 << 63) - 1 (every where 1 except the left most bit)
+        How django pks map to the id and the extra columns depends on the pk
+        strategy of the model, see django_milvus.pk.
         """
-        return [
-            FieldSchema(
-                name="id",
-                dtype=DataType.INT64,
-                is_primary=True,
-            ),
-            FieldSchema(
-                name="django_pk_high",
-                dtype=DataType.INT64,
-            ),
-            FieldSchema(
-                name="django_pk_mid",
-                dtype=DataType.INT64,
-            ),
-            FieldSchema(
-                name="django_pk_low",
-                dtype=DataType.INT64,
-            ),
-        ] + [
-            FieldSchema(
-                name=f.attname,  # this is the field name on the django model
-                dtype=f.dtype,  #  user specifies the type on the MilvusField on the Django model
-                dim=f.dim,
-            )
-            for f in self.get_sorted_model_fields(model)
-        ]
+        options = get_milvus_options(model)
+        return (
+            options.pk_strategy.get_field_schemas()
+            + [
+                FieldSchema(
+                    name=FINGERPRINT_FIELD_NAME,
+                    dtype=DataType.INT64,
+                ),
+            ]
+            + [
+                FieldSchema(name=f.attname, dtype=options.get_mirror_dtype(f))
+                for f in options.mirror_fields
+            ]
+            + [
+                FieldSchema(
+                    name=f.attname,  # this is the field name on the django model
+                    dtype=f.dtype,  #  user specifies the type on the MilvusField on the Django model
+                    dim=f.dim,
+                )
+                for f in self.get_sorted_model_fields(model)
+            ]
+        )
 
-    def get_milvus_id_value(self, instance: Model) -> Int64:
-        high, mid, low = self.get_django_pk_values(instance)
-        return high ^ mid ^ low
+    def get_milvus_id_value(self, instance: Model) -> Any:
+        return self.get_milvus_id_value_from_pk(instance._meta.model, instance.pk)
 
-    def get_django_pk_values(self, instance: Model) -> List[Int64]:
-        """Returns [django_pk_high, django_pk_mid, django_pk_low]"""
-        if isinstance(instance.pk, int):
-            pk = instance.pk  # int64
-        elif isinstance(instance.pk, UUID):
-            pk = instance.pk.int  # int128
-        else:
-            raise NotImplementedError()
-        mask_high = 0b11
-        mask_mid = mask_low = (1 << 63) - 1
-        high = (pk >> 126) & mask_high
-        mid = (pk >> 63) & mask_mid
-        low = pk & mask_low
-        assert high.bit_length() <= 2, f"{high.bit_length()} > 2"
-        assert mid.bit_length() <= 63, f"{mid.bit_length()} > 63"
-        assert low.bit_length() <= 63, f"{low.bit_length()} > 63"
-        return [high, mid, low]
+    def get_milvus_id_value_from_pk(self, model: Type[Model], pk: Any) -> Any:
+        ids = get_milvus_options(model).pk_strategy.encode([pk])[0]
+        return ids[0].item()
 
     def update_entry(self, instance: Model) -> None:
         self.check_schema(instance._meta.model)
         self.delete_entry(instance)
         self.insert_entry(instance)
 
-    def bulk_update_entries(self, queryset: QuerySet) -> None:
+    async def aupdate_entry(self, instance: Model) -> None:
+        await self.adelete_entries_by_pk(instance._meta.model, [instance.pk])
+        await self.ainsert_entry(instance)
+
+    def bulk_update_entries(
+        self, queryset: QuerySet, batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> None:
         self.bulk_delete_entries(queryset)
-        self.bulk_insert_entries(queryset)
+        self.bulk_insert_entries(queryset, batch_size=batch_size)
 
     def check_schema(self, model: Type[Model]) -> None:
+        if not self.has_current_schema(model):
+            expected = [f.name for f in self.get_milvus_field_schemas(model)]
+            actual = [f.name for f in self.get_collection(model).schema.fields]
+            raise ValueError(
+                f"Schema mismatch: {expected=} {actual=}, run rebuild_index()"
+            )
+
+    def has_current_schema(self, model: Type[Model]) -> bool:
+        """Whether the collection has the fields of get_milvus_field_schemas(),
+        with the same types and dims."""
         current_fields = self.get_milvus_field_schemas(model)
         collection_fields: List[FieldSchema] = self.get_collection(model).schema.fields
-        expected = [f.attname for f in current_fields]
-        actual = [f.name for f in collection_fields]
-        if expected != expected:
-            raise ValueError(f"Schema mismatch: {expected=} {actual=}")
+        return [get_field_signature(f) for f in current_fields] == [
+            get_field_signature(f) for f in collection_fields
+        ]
 
     def delete_entry(self, instance: Model) -> None:
-        # pk = instance.pk
-        # collection = self.get_collection(instance._meta.model)
-        # collection.delete(pk)
-        ...
+        self.delete_entries_by_pk(instance._meta.model, [instance.pk])
 
-    def bulk_delete_entries(self, queryset: QuerySet) -> None:
-        ...
+    def bulk_delete_entries(
+        self, queryset: QuerySet, batch_size: int = DEFAULT_DELETE_BATCH_SIZE
+    ) -> None:
+        pks = queryset.values_list("pk", flat=True).iterator(chunk_size=batch_size)
+        while True:
+            chunk = list(islice(pks, batch_size))
+            if not chunk:
+                return
+            self.delete_entries_by_pk(queryset.model, chunk, batch_size=batch_size)
+
+    def delete_entries_by_pk(
+        self,
+        model: Type[Model],
+        pks: Sequence[Any],
+        batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+    ) -> None:
+        """Deletes the rows of the given django pks, batch_size ids per
+        delete expression."""
+        ids = get_milvus_options(model).pk_strategy.encode(pks)[0]
+        self.delete_ids(model, ids, batch_size)
+
+    def delete_ids(
+        self,
+        model: Type[Model],
+        ids: np.ndarray,
+        batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+    ) -> None:
+        strategy = get_milvus_options(model).pk_strategy
+        ids = np.unique(ids)
+        if not len(ids):
+            return
+        collection = self.get_collection(model)
+        for start in range(0, len(ids), batch_size):
+            collection.delete(
+                f"id in {strategy.format_ids(ids[start : start + batch_size])}"
+            )
+        self.invalidate_search_cache(model)
+
+    async def adelete_entries_by_pk(
+        self,
+        model: Type[Model],
+        pks: Sequence[Any],
+        batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+    ) -> None:
+        strategy = get_milvus_options(model).pk_strategy
+        ids = np.unique(strategy.encode(pks)[0])
+        if not len(ids):
+            return
+        collection = await self.aget_collection(model)
+        for start in range(0, len(ids), batch_size):
+            expr = f"id in {strategy.format_ids(ids[start : start + batch_size])}"
+            await await_milvus_future(collection.delete(expr, _async=True))
+        self.invalidate_search_cache(model)
 
     def insert_entry(self, instance: Model) -> None:
-        collection = self.get_collection(instance._meta.model)
-        rows = [self.get_milvus_values(instance)]
-        collection.insert(transpose(rows))
-
-    def bulk_insert_entries(self, queryset: QuerySet) -> None:
-        if queryset:
-            collection = self.get_collection(queryset.model)
-            rows = self.get_bulk_milvus_values(queryset)
-            collection.insert(transpose(rows))
-
-    def get_milvus_values(self, instance: Model) -> List[int]:
-        """Returns a row of milvus values to insert."""
-        fields = self.get_sorted_model_fields(instance._meta.model)
-        values = [getattr(instance, f.attname) for f in fields]
-        row = [
-            self.get_milvus_id_value(instance),
-            *self.get_django_pk_values(instance),
-            *values,
+        model = instance._meta.model
+        scalars = self.get_scalar_values(model, [instance])
+        self.insert_columns(
+            model,
+            self.get_entry_columns(instance),
+            self.get_partitions(model, scalars),
+        )
+
+    def insert_values(
+        self, model: Type[Model], pks: Sequence[Any], values: Dict[str, Sequence[Any]]
+    ) -> None:
+        """Inserts rows given as a pk column and a {attname: column} dict of
+        MilvusField values, which may contain fields of other databases, and
+        of the fields of MilvusOptions.get_scalar_attnames()."""
+        fields = self.get_sorted_model_fields(model)
+        vectors = [values[f.attname] for f in fields]
+        pks, vectors, values = self.drop_invalid_rows(model, pks, vectors, values)
+        if not pks:
+            return
+        self.insert_columns(
+            model,
+            self.get_milvus_columns(model, pks, vectors, values),
+            self.get_partitions(model, values),
+        )
+
+    def insert_columns(
+        self,
+        model: Type[Model],
+        columns: List[np.ndarray],
+        partitions: Optional[Sequence[Any]] = None,
+    ) -> None:
+        self.write_columns(self.get_collection(model), model, columns, partitions)
+        self.invalidate_search_cache(model)
+
+    def write_columns(
+        self,
+        collection: Collection,
+        model: Type[Model],
+        columns: List[np.ndarray],
+        partitions: Optional[Sequence[Any]] = None,
+    ) -> int:
+        """Inserts columns into collection, with one insert per partition if
+        the model is partitioned. partitions holds the value of the partition
+        field of each row. Returns the number of inserted rows, see
+        insert_or_bisect()."""
+        inserted = 0
+        for partition_name, group in self.group_by_partition(
+            collection, model, columns, partitions
+        ):
+            inserted += self.insert_or_bisect(collection, model, group, partition_name)
+        return inserted
+
+    def insert_or_bisect(
+        self,
+        collection: Collection,
+        model: Type[Model],
+        columns: List[np.ndarray],
+        partition_name: Optional[str] = None,
+    ) -> int:
+        """Inserts columns. If milvus refuses their data (see is_data_error()),
+        their halves are inserted separately, recursively, to isolate the rows
+        it can't store: only those are left out, and rejected (see
+        django_milvus.validation). Other errors, such as milvus being down or
+        a timeout, are raised right away, and so is the error if no row at all
+        could be inserted. Returns the number of inserted rows."""
+        try:
+            collection.insert(
+                self.get_insert_data(model, columns), partition_name=partition_name
+            )
+            return len(columns[0])
+        except Exception as e:
+            if not is_data_error(e):
+                raise
+            error = e
+        rejected: Dict[Any, str] = {}
+        inserted = self.bisect_insert(
+            collection, model, columns, partition_name, error, rejected
+        )
+        if not inserted:
+            raise error
+        reject_rows(model, rejected)
+        return inserted
+
+    def bisect_insert(
+        self,
+        collection: Collection,
+        model: Type[Model],
+        columns: List[np.ndarray],
+        partition_name: Optional[str],
+        error: Exception,
+        rejected: Dict[Any, str],
+    ) -> int:
+        """Inserts the halves of columns, which milvus refused with error,
+        adding the pks of the rows it refuses on their own to rejected."""
+        count = len(columns[0])
+        if count == 1:
+            strategy = get_milvus_options(model).pk_strategy
+            extra = columns[1 : 1 + len(strategy.field_names)]
+            [pk] = strategy.decode(columns[0], extra)
+            rejected[pk] = str(error)
+            return 0
+        inserted = 0
+        for half in (slice(0, count // 2), slice(count // 2, count)):
+            part = [column[half] for column in columns]
+            try:
+                collection.insert(
+                    self.get_insert_data(model, part), partition_name=partition_name
+                )
+                inserted += len(part[0])
+            except Exception as e:
+                if not is_data_error(e):
+                    raise
+                inserted += self.bisect_insert(
+                    collection, model, part, partition_name, e, rejected
+                )
+        return inserted
+
+    def get_insert_data(
+        self, model: Type[Model], columns: List[np.ndarray]
+    ) -> List[Any]:
+        """Converts the vector columns to what collection.insert() receives,
+        see MilvusField.get_insert_values()."""
+        fields = self.get_sorted_model_fields(model)
+        offset = len(columns) - len(fields)
+        return columns[:offset] + [
+            f.get_insert_values(column) for f, column in zip(fields, columns[offset:])
+        ]
+
+    async def ainsert_entry(self, instance: Model) -> None:
+        model = instance._meta.model
+        collection = await self.aget_collection(model)
+        columns = self.get_entry_columns(instance)
+        partitions = self.get_partitions(
+            model, self.get_scalar_values(model, [instance])
+        )
+        if partitions is not None:
+            # Creating the partition, the first time, is a blocking call.
+            [(partition_name, _)] = await run_blocking(
+                self.group_by_partition, collection, model, columns, partitions
+            )
+            future = collection.insert(
+                self.get_insert_data(model, columns),
+                partition_name=partition_name,
+                _async=True,
+            )
+        else:
+            future = collection.insert(
+                self.get_insert_data(model, columns), _async=True
+            )
+        await await_milvus_future(future)
+        self.invalidate_search_cache(model)
+
+    def get_entry_columns(self, instance: Model) -> List[np.ndarray]:
+        model = instance._meta.model
+        vectors = [
+            [getattr(instance, f.attname)] for f in self.get_sorted_model_fields(model)
+        ]
+        scalars = self.get_scalar_values(model, [instance])
+        return self.get_milvus_columns(model, [instance.pk], vectors, scalars)
+
+    def get_scalar_values(
+        self, model: Type[Model], instances: Sequence[Model]
+    ) -> Dict[str, List[Any]]:
+        """Returns the {attname: column} of MilvusOptions.get_scalar_attnames()
+        for the given instances."""
+        return {
+            attname: [getattr(obj, attname) for obj in instances]
+            for attname in get_milvus_options(model).get_scalar_attnames()
+        }
+
+    def get_partitions(
+        self, model: Type[Model], scalars: Dict[str, Sequence[Any]]
+    ) -> Optional[Sequence[Any]]:
+        """Returns the partition field column, None if the model is not
+        partitioned."""
+        partition_field = get_milvus_options(model).partition_field
+        if partition_field is None:
+            return None
+        return scalars[partition_field.attname]
+
+    def group_by_partition(
+        self,
+        collection: Collection,
+        model: Type[Model],
+        columns: List[np.ndarray],
+        partitions: Optional[Sequence[Any]],
+    ) -> List[Tuple[Optional[str], List[np.ndarray]]]:
+        """Splits the columns by partition, creating the partitions that don't
+        exist yet. Returns a single (None, columns) group if the model is not
+        partitioned."""
+        if partitions is None:
+            return [(None, columns)]
+        options = get_milvus_options(model)
+        rows: Dict[str, List[int]] = {}
+        for i, value in enumerate(partitions):
+            rows.setdefault(options.get_partition_name(value), []).append(i)
+        for partition_name in rows:
+            self.create_partition(collection, partition_name)
+        if len(rows) == 1:
+            return [(partition_name, columns)]
+        return [
+            (partition_name, [column[indexes] for column in columns])
+            for partition_name, indexes in rows.items()
         ]
-        return row
 
-    def get_bulk_milvus_values(self, queryset: QuerySet) -> List[List[Any]]:
-        values: List[List[Any]] = []
-        for q in queryset:
-            values.append(self.get_milvus_values(q))
-        return values
+    def get_partition_names(self, collection: Collection) -> Set[str]:
+        """Returns the cached partition names of collection. Listing them
+        costs an RPC."""
+        names = self.partitions.get(collection.name)
+        if names is None:
+            names = set(p.name for p in collection.partitions)
+            self.partitions[collection.name] = names
+        return names
+
+    def create_partition(self, collection: Collection, partition_name: str) -> None:
+        if partition_name in self.get_partition_names(collection):
+            return
+        if not collection.has_partition(partition_name):
+            collection.create_partition(partition_name)
+        self.partitions[collection.name].add(partition_name)
+
+    def get_search_partition_names(self, model: Type[Model]) -> Optional[List[str]]:
+        """Returns the partitions to search given the filters in effect, see
+        django_milvus.filters, or None to search the whole collection."""
+        names = get_filtered_partition_names(model)
+        if names is None:
+            return None
+        return self.get_existing_partition_names(model, names)
+
+    async def aget_search_partition_names(
+        self, model: Type[Model]
+    ) -> Optional[List[str]]:
+        """Async version of get_search_partition_names(). Listing the
+        partitions runs in the default executor, unless they are cached."""
+        names = get_filtered_partition_names(model)
+        if names is None:
+            return None
+        collection = self.collections.get(self.get_collection_name(model))
+        if collection is not None and names <= self.partitions.get(
+            collection.name, set()
+        ):
+            return sorted(names)
+        return await run_blocking(self.get_existing_partition_names, model, names)
+
+    def get_existing_partition_names(
+        self, model: Type[Model], names: Set[str]
+    ) -> List[str]:
+        """Returns the partitions of names that the model's collection has."""
+        collection = self.get_collection(model)
+        if not names <= self.get_partition_names(collection):
+            # Another process may have created them since they were listed.
+            self.partitions.pop(collection.name, None)
+        return sorted(names & self.get_partition_names(collection))
+
+    def bulk_insert_entries(
+        self,
+        queryset: QuerySet,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        collection_name: Optional[str] = None,
+        workers: int = 1,
+    ) -> int:
+        """Streams the queryset into milvus, one insert per batch. Only the pk
+        and the MilvusField columns are read, so memory usage is bounded by
+        batch_size no matter how large the table is. Returns the number of
+        inserted rows.
+
+        Inserts into the model's collection, or into collection_name. With
+        more than one worker, the whole table is inserted by a process pool,
+        see django_milvus.parallel."""
+        if workers > 1 and self.backend.shared:
+            from django_milvus.parallel import parallel_bulk_insert_entries
+
+            return parallel_bulk_insert_entries(
+                self, queryset, workers, batch_size, collection_name
+            )
+        collection: Optional[Collection] = None
+        count = 0
+        for columns, partitions in self.iter_milvus_columns(queryset, batch_size):
+            if collection is None:
+                collection = self.get_collection_by_name(
+                    collection_name or self.get_collection_name(queryset.model)
+                )
+            count += self.write_columns(collection, queryset.model, columns, partitions)
+        if count:
+            self.invalidate_search_cache(queryset.model)
+        return count
+
+    def bulk_insert_instances(
+        self,
+        model: Type[Model],
+        instances: Sequence[Model],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        """Inserts instances that are in memory already, such as the objects
+        given to bulk_create(), one insert per batch."""
+        fields = self.get_sorted_model_fields(model)
+        for start in range(0, len(instances), batch_size):
+            chunk = instances[start : start + batch_size]
+            vectors = [[getattr(obj, f.attname) for obj in chunk] for f in fields]
+            pks = [obj.pk for obj in chunk]
+            scalars = self.get_scalar_values(model, chunk)
+            pks, vectors, scalars = self.drop_invalid_rows(model, pks, vectors, scalars)
+            if not pks:
+                continue
+            self.insert_columns(
+                model,
+                self.get_milvus_columns(model, pks, vectors, scalars),
+                self.get_partitions(model, scalars),
+            )
+
+    def drop_invalid_rows(
+        self,
+        model: Type[Model],
+        pks: Sequence[Any],
+        vectors: Sequence[Sequence[Any]],
+        scalars: Dict[str, Sequence[Any]],
+    ) -> Tuple[Sequence[Any], Sequence[Sequence[Any]], Dict[str, Sequence[Any]]]:
+        """Leaves the rows with invalid vectors out of a batch, so that they
+        don't fail the insert of the others, and rejects them (see
+        django_milvus.validation and MilvusField.get_invalid_vectors())."""
+        fields = self.get_sorted_model_fields(model)
+        invalid: Dict[int, str] = {}
+        for f, column in zip(fields, vectors):
+            for i, reason in f.get_invalid_vectors(column).items():
+                invalid.setdefault(i, f"{f.attname}: {reason}")
+        if not invalid:
+            return pks, vectors, scalars
+        reject_rows(model, {pks[i]: reason for i, reason in invalid.items()})
+        keep = [i for i in range(len(pks)) if i not in invalid]
+
+        def pick(column: Sequence[Any]) -> List[Any]:
+            return [column[i] for i in keep]
+
+        return (
+            pick(pks),
+            [pick(column) for column in vectors],
+            {attname: pick(column) for attname, column in scalars.items()},
+        )
+
+    def get_milvus_columns(
+        self,
+        model: Type[Model],
+        pks: Sequence[Any],
+        vectors: Sequence[Sequence[Any]],
+        scalars: Optional[Dict[str, Sequence[Any]]] = None,
+    ) -> List[np.ndarray]:
+        """Returns the columns to insert, in the layout described by
+        get_milvus_field_schemas(). vectors holds one column of values for each
+        of the sorted MilvusFields, and scalars a {attname: column} dict that
+        must contain the mirror and partition fields if the model has any.
+        The fingerprint column covers all of them. Apart from partition
+        names, no per row python objects are created: the pk columns are computed with numpy and every
+        vector column is stacked into a single contiguous (n, dim) array."""
+        fields = self.get_sorted_model_fields(model)
+        arrays = [f.get_milvus_array(column) for f, column in zip(fields, vectors)]
+        options = get_milvus_options(model)
+        mirrors = [
+            options.get_mirror_array(f, scalars[f.attname])  # type: ignore
+            for f in options.mirror_fields
+        ]
+        hashed = mirrors + arrays
+        partitions = self.get_partitions(model, scalars or {})
+        if partitions is not None:
+            # So that moving a row to another partition changes it too.
+            names = [options.get_partition_name(value) for value in partitions]
+            hashed.append(get_label_fingerprints(names))
+        return [
+            *options.pk_strategy.encode(pks),
+            get_fingerprints(hashed),
+            *mirrors,
+            *arrays,
+        ]
+
+    def iter_milvus_columns(
+        self, queryset: QuerySet, batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Tuple[List[np.ndarray], Optional[Sequence[Any]]]]:
+        """Yields the insert columns of at most batch_size rows at a time,
+        and the partition field values of the rows if the model is
+        partitioned, see get_partitions(). The queryset is read with a server side cursor over
+        (pk, *milvus_fields, *scalar_fields) instead of loading whole model
+        instances."""
+        fields = self.get_sorted_model_fields(queryset.model)
+        scalar_attnames = get_milvus_options(queryset.model).get_scalar_attnames()
+        values = queryset.values_list(
+            "pk", *[f.attname for f in fields], *scalar_attnames
+        ).iterator(chunk_size=batch_size)
+        while True:
+            chunk = list(islice(values, batch_size))
+            if not chunk:
+                return
+            pks, *vectors = zip(*chunk)
+            scalars = dict(zip(scalar_attnames, vectors[len(fields) :]))
+            vectors = vectors[: len(fields)]
+            pks, vectors, scalars = self.drop_invalid_rows(
+                queryset.model, pks, vectors, scalars
+            )
+            if not pks:
+                continue
+            columns = self.get_milvus_columns(queryset.model, pks, vectors, scalars)
+            yield columns, self.get_partitions(queryset.model, scalars)
+
+    def sync_collection(
+        self, queryset: QuerySet, batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Dict[str, int]:
+        """Makes the collection match the queryset by only inserting the rows
+        that are new or whose vectors changed, and deleting the rows that are
+        gone. Returns the number of inserted, deleted and unchanged rows.
+
+        The queryset is read once to fingerprint every row, keeping only the
+        pk columns and the fingerprints in memory. The
+        collection is then read once, as windows of ids between the sorted ids
+        of the database, and only the changed rows are read again to be
+        inserted. Expects the collection to have the current schema."""
+        model = queryset.model
+        strategy = get_milvus_options(model).pk_strategy
+        pk_columns, fingerprints = self.get_fingerprint_columns(queryset, batch_size)
+        ids = pk_columns[0]
+        order = np.argsort(ids, kind="stable")
+        ids, fingerprints = ids[order], fingerprints[order]
+        collection = self.load_collection(model)
+        changed = np.zeros(len(ids), dtype=bool)
+        stale: List[np.ndarray] = []
+        for start in range(0, max(len(ids), 1), batch_size):
+            end = min(start + batch_size, len(ids))
+            lo = ids[start] if start else strategy.min_id
+            expr = f"id >= {strategy.format_id(lo)}"
+            if end < len(ids):
+                expr += f" and id < {strategy.format_id(ids[end])}"
+            rows = collection.query(expr, output_fields=[FINGERPRINT_FIELD_NAME])
+            stored_ids = np.array([r["id"] for r in rows], dtype=ids.dtype)
+            stored = np.array([r[FINGERPRINT_FIELD_NAME] for r in rows], np.int64)
+            window = ids[start:end]
+            if len(window):
+                index = np.searchsorted(window, stored_ids)
+                index = np.minimum(index, len(window) - 1)
+                found = window[index] == stored_ids
+            else:
+                index = np.zeros(len(stored_ids), dtype=np.int64)
+                found = np.zeros(len(stored_ids), dtype=bool)
+            stale.append(stored_ids[~found])
+            index, stored = index[found], stored[found]
+            same = fingerprints[start:end][index] == stored
+            # A row is unchanged if milvus holds it exactly once, as it is.
+            unchanged = np.zeros(len(window), dtype=bool)
+            unchanged[index[same]] = True
+            unchanged[index[~same]] = False
+            counts = np.bincount(index, minlength=len(window))
+            changed[start:end] = ~unchanged | (counts > 1)
+        deleted = np.concatenate(stale) if stale else ids[:0]
+        self.delete_ids(model, np.concatenate([deleted, ids[changed]]))
+        changed_pks = strategy.decode(
+            ids[changed], [column[order][changed] for column in pk_columns[1:]]
+        )
+        inserted = 0
+        for start in range(0, len(changed_pks), batch_size):
+            chunk = changed_pks[start : start + batch_size]
+            inserted += self.bulk_insert_entries(
+                queryset.filter(pk__in=chunk), batch_size=batch_size
+            )
+        return {
+            "inserted": inserted,
+            "deleted": len(deleted),
+            "unchanged": int(len(ids) - changed.sum()),
+        }
+
+    def get_fingerprint_columns(
+        self, queryset: QuerySet, batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Tuple[List[np.ndarray], np.ndarray]:
+        """Returns the pk columns (the id and the extra columns of the pk
+        strategy) and the fingerprint column of every row of the queryset,
+        computed a batch at a time."""
+        strategy = get_milvus_options(queryset.model).pk_strategy
+        count = 1 + len(strategy.field_names)
+        columns: List[List[np.ndarray]] = [[] for _ in range(count + 1)]
+        for batch, _ in self.iter_milvus_columns(queryset, batch_size):
+            for column, values in zip(columns, batch[: count + 1]):
+                column.append(values)
+        if not columns[0]:
+            return strategy.encode([]), np.empty(0, dtype=np.int64)
+        *pk_columns, fingerprints = [np.concatenate(c) for c in columns]
+        return pk_columns, fingerprints
+
+    def search(
+        self,
+        model: Type[Model],
+        field: MilvusField,
+        vectors: Sequence[Any],
+        limit: int,
+    ) -> List[SearchResult]:
+        """Searches the limit nearest rows of each vector. Returns a
+        (django_pks, distances) pair per vector, nearest first.
+
+        The django pk columns are returned as output fields of the search, so
+        this is a single round trip to milvus. Only the vectors missing from
+        the search cache, if one is configured, are searched."""
+        return [
+            (pks[:limit], distances[:limit])
+            for pks, distances in self.search_candidates(model, field, vectors, limit)
+        ]
+
+    def search_candidates(
+        self,
+        model: Type[Model],
+        field: MilvusField,
+        vectors: Sequence[Any],
+        limit: int,
+    ) -> List[SearchResult]:
+        """Like search(), but returns every hit milvus was asked for: with
+        the overfetch search param, ceil(limit * overfetch) of them, the
+        candidates that search_nearest() filters."""
+        kwargs = self.get_search_kwargs(
+            model, field, vectors, limit, self.get_search_partition_names(model)
+        )
+        if kwargs.get("partition_names") == []:
+            # None of the partitions the filters allow exist, nothing matches.
+            return [([], []) for _ in vectors]
+        keys, results = self.get_cached_search_results(model, kwargs)
+        missing = [i for i, r in enumerate(results) if r is None]
+        if not missing:
+            return results  # type: ignore
+        if len(missing) < len(results):
+            kwargs = {**kwargs, "data": [kwargs["data"][i] for i in missing]}
+        try:
+            result = self.load_collection(model).search(**kwargs)
+        except Exception as error:
+            if not is_retryable_error(error):
+                raise
+            # The collection may have been rebuilt by another process since it
+            # was cached, or the connection lost, try again with a fresh handle.
+            self.invalidate_collection(model)
+            result = self.load_collection(model).search(**kwargs)
+        found = [self.decode_hits(model, hits) for hits in result]
+        return self.merge_search_results(keys, results, found)
+
+    def search_nearest(
+        self, model: Type[Model], field: MilvusField, vector: Any, limit: int
+    ) -> SearchResult:
+        """Searches the limit nearest rows of vector, for a nearest lookup
+        or MilvusQuerySet.nearest().
+
+        With the overfetch search param, ceil(limit * overfetch) hits are
+        searched, and the limit nearest of those that match the other
+        filters of the queryset are kept. With the adaptive search param, if
+        fewer than limit of the hits match, the search is repeated with a
+        limit ADAPTIVE_GROWTH times larger, until enough of them do, the
+        collection has no more rows, or the max_limit search param
+        (MAX_SEARCH_LIMIT by default) is reached. Returns at most limit rows,
+        and records the number of rounds, see
+        MilvusQuerySet.milvus_search_rounds."""
+        search = NearestSearch(model, limit)
+        while not search.done:
+            [(pks, distances)] = self.search_candidates(
+                model, field, [vector], search.search_limit
+            )
+            search.add_round(pks, distances, search.get_matching_pks(pks))
+        return search.get_result()
+
+    async def asearch_nearest(
+        self, model: Type[Model], field: MilvusField, vector: Any, limit: int
+    ) -> SearchResult:
+        """Async version of search_nearest(), for MilvusQuerySet.anearest().
+        The hits are checked against the filters with sync_to_async."""
+        search = NearestSearch(model, limit)
+        while not search.done:
+            [(pks, distances)] = await self.asearch_candidates(
+                model, field, [vector], search.search_limit
+            )
+            matching = await sync_to_async(search.get_matching_pks)(pks)
+            search.add_round(pks, distances, matching)
+        return search.get_result()
+
+    async def asearch(
+        self,
+        model: Type[Model],
+        field: MilvusField,
+        vectors: Sequence[Any],
+        limit: int,
+    ) -> List[SearchResult]:
+        """Async version of search(). Many searches can be in flight on the
+        same event loop, each one is a grpc future, not a thread."""
+        results = await self.asearch_candidates(model, field, vectors, limit)
+        return [(pks[:limit], distances[:limit]) for pks, distances in results]
+
+    async def asearch_candidates(
+        self,
+        model: Type[Model],
+        field: MilvusField,
+        vectors: Sequence[Any],
+        limit: int,
+    ) -> List[SearchResult]:
+        """Async version of search_candidates()."""
+        kwargs = self.get_search_kwargs(
+            model,
+            field,
+            vectors,
+            limit,
+            await self.aget_search_partition_names(model),
+        )
+        if kwargs.get("partition_names") == []:
+            # None of the partitions the filters allow exist, nothing matches.
+            return [([], []) for _ in vectors]
+        keys, results = self.get_cached_search_results(model, kwargs)
+        missing = [i for i, r in enumerate(results) if r is None]
+        if not missing:
+            return results  # type: ignore
+        if len(missing) < len(results):
+            kwargs = {**kwargs, "data": [kwargs["data"][i] for i in missing]}
+
+        async def search() -> Any:
+            collection = await self.aload_collection(model)
+            return await await_milvus_future(collection.search(**kwargs, _async=True))
+
+        try:
+            result = await search()
+        except Exception as error:
+            if not is_retryable_error(error):
+                raise
+            self.invalidate_collection(model)
+            result = await search()
+        found = [self.decode_hits(model, hits) for hits in result]
+        return self.merge_search_results(keys, results, found)
+
+    def get_cached_search_results(
+        self, model: Type[Model], kwargs: Dict[str, Any]
+    ) -> Tuple[List[str], List[Optional[SearchResult]]]:
+        """Returns the cache keys of the searched vectors and their cached
+        results, None for the misses."""
+        cache = get_search_cache()
+        if cache is None:
+            return [], [None] * len(kwargs["data"])
+        keys = cache.get_keys(self.dbname, self.get_collection_name(model), kwargs)
+        return keys, cache.get_many(keys)
+
+    def merge_search_results(
+        self,
+        keys: List[str],
+        results: List[Optional[SearchResult]],
+        found: List[SearchResult],
+    ) -> List[SearchResult]:
+        """Fills the misses in results with found, in order, and caches them."""
+        missing = [i for i, r in enumerate(results) if r is None]
+        for i, value in zip(missing, found):
+            results[i] = value
+        cache = get_search_cache()
+        if cache is not None and keys:
+            cache.set_many({keys[i]: results[i] for i in missing})  # type: ignore
+        return results  # type: ignore
+
+    def get_search_kwargs(
+        self,
+        model: Type[Model],
+        field: MilvusField,
+        vectors: Sequence[Any],
+        limit: int,
+        partition_names: Optional[List[str]],
+    ) -> Dict[str, Any]:
+        """partition_names are the partitions to search, None for the whole
+        collection, see get_search_partition_names()."""
+        # SearchResult is a 2d-array-like class, the first dimension is the
+        # number of vectors to query (nq), the second dimension is the number
+        # of limit (topk).
+        overrides = get_search_params()
+        limit = math.ceil(limit * overrides.get("overfetch", 1))
+        params = field.get_search_params(overrides)
+        if "ef" in params:
+            # HNSW can't return more than ef hits.
+            params["ef"] = max(params["ef"], limit)
+        kwargs = {
+            "data": field.get_search_vectors(vectors),
+            "anns_field": field.attname,
+            "param": {"metric_type": field.metric_type, "params": params},
+            "limit": limit,
+            "output_fields": get_milvus_options(model).pk_strategy.field_names,
+        }
+        if partition_names is not None:
+            kwargs["partition_names"] = partition_names
+        expr = get_filter_expr(model)
+        if expr is not None:
+            kwargs["expr"] = expr
+        return kwargs
+
+    def decode_hits(self, model: Type[Model], hits: Any) -> SearchResult:
+        strategy = get_milvus_options(model).pk_strategy
+        ids = [hit.id for hit in hits]
+        extra = [
+            [hit.entity.get(name) for hit in hits] for name in strategy.field_names
+        ]
+        pks = strategy.decode(ids, extra)
+        return pks, list(hits.distances)
 
     def flush(self, model: Type[Model]) -> None:
-        pymilvus.utility.get_connection().flush([self.get_collection_name(model)])
+        self.backend.flush([self.get_collection_name(model)])
+
 
+def get_field_signature(field: FieldSchema) -> Tuple[str, DataType, Optional[int]]:
+    params = field.params or {}
+    dim = params.get("dim")
+    return field.name, DataType(field.dtype), None if dim is None else int(dim)
 
-T = TypeVar("T")
 
+class NearestSearch:
+    """The rounds of a search_nearest(): the state that decides whether the
+    hits match the filters enough, shared by the sync and async versions,
+    which do the searches and the SQL queries. The filters, search params and
+    database in effect are read when it is created."""
 
-def transpose(values: List[List[T]]) -> List[List[T]]:
-    """The collection.insert() API takes columns instead of rows. Use this
-    helper to transpose the input if needed.s"""
-    return list(zip(*values))  # type:ignore
+    def __init__(self, model: Type[Model], limit: int) -> None:
+        params = get_search_params()
+        adaptive = params.get("adaptive")
+        self.model = model
+        self.limit = limit
+        self.overfetch = params.get("overfetch", 1)
+        self.filters = (
+            get_sql_filters(model) if adaptive or self.overfetch > 1 else None
+        )
+        self.using = get_search_database(model)
+        self.max_limit = limit
+        if adaptive and self.filters:
+            self.max_limit = max(limit, params.get("max_limit", MAX_SEARCH_LIMIT))
+        self.search_limit = limit
+        self.rounds = 0
+        self.done = False
+        self.hits: SearchResult = ([], [])
+        self.matching: Set[Any] = set()
+
+    def get_matching_pks(self, pks: Sequence[Any]) -> Set[Any]:
+        """Returns the pks of the hits that match the filters, with an SQL
+        query if there are any."""
+        if not self.filters:
+            return set(pks)
+        return set(
+            QuerySet(model=self.model, using=self.using)
+            .filter(*self.filters, pk__in=pks)
+            .values_list("pk", flat=True)
+        )
+
+    def add_round(
+        self, pks: List[Any], distances: List[float], matching: Set[Any]
+    ) -> None:
+        """Records the hits of a search of search_limit rows, and either
+        grows search_limit for another round or sets done."""
+        self.rounds += 1
+        self.hits, self.matching = (pks, distances), matching
+        if (
+            len(matching) >= self.limit
+            or len(pks) < math.ceil(self.search_limit * self.overfetch)
+            or self.search_limit >= self.max_limit
+        ):
+            self.done = True
+        else:
+            self.search_limit = min(self.search_limit * ADAPTIVE_GROWTH, self.max_limit)
+
+    def get_result(self) -> SearchResult:
+        """Returns the limit nearest matching hits of the last round."""
+        add_search_rounds(self.rounds)
+        if self.filters:
+            logger.debug(
+                "Filtered search of %s found %d of %d rows in %d rounds",
+                self.model._meta.label,
+                len(self.matching),
+                self.limit,
+                self.rounds,
+            )
+        pks, distances = self.hits
+        hits = [(pk, d) for pk, d in zip(pks, distances) if pk in self.matching]
+        hits = hits[: self.limit]
+        return [pk for pk, _ in hits], [d for _, d in hits]
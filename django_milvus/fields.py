@@ -1,16 +1,28 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Type
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Type
 
-from django.db.models import JSONField
+import numpy as np
+from django.core import checks
+from django.db.models import JSONField, Model
 from django.db.models.lookups import Lookup
+from django.db.models.signals import post_delete, post_save
 from pymilvus.client.types import DataType
 
+from .indexes import IndexSpec, get_index_spec
 from .lookups import get_nearest_n
+from .signals import delete_entry_on_model_delete, sync_entry_on_model_save
 
 if TYPE_CHECKING:
     from django_milvus.connection import Connection
 
+# The numpy dtypes of the binary storages, little endian whatever the platform.
+STORAGE_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+# Binary vectors, 8 bits per byte.
+PACKED_STORAGE = "packed"
+
+BytesLike = (bytes, bytearray, memoryview)
+
 
 class MilvusField(JSONField):
     def __init__(
@@ -23,8 +35,31 @@ class MilvusField(JSONField):
         nprobe: int = 32,
         metric_type: str = "L2",
         index_type: str = "IVF_FLAT",
+        index_params: Optional[Dict[str, Any]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        storage: Optional[str] = None,
         **kwargs: Any,
     ) -> None:
+        """index_params and search_params hold the params of index_type
+        that are used to build the index and to search it, for example
+        index_type="HNSW", index_params={"M": 32, "efConstruction": 256},
+        search_params={"ef": 128}. See django_milvus.indexes for the supported
+        index types and their params. Missing params get milvus' recommended
+        defaults; nlist and nprobe are used by the IVF indexes unless they are
+        in index_params/search_params.
+
+        storage is how the vectors are stored in the django database: "json"
+        (a list of numbers), or "float32"/"float16" (packed little endian
+        floats in a binary column). Vectors in binary storage are loaded as
+        read-only numpy arrays over the fetched bytes, without any decoding.
+        Use django_milvus.operations.ConvertMilvusFieldStorage to migrate
+        existing rows when changing it.
+
+        BINARY_VECTOR fields take either dim bits (a list of 0/1 or bools) or
+        dim / 8 bytes of packed bits (bytes or an uint8 array) as vectors,
+        need a BIN_ index type and a binary metric (HAMMING, JACCARD,
+        TANIMOTO), and default to the "packed" storage, which keeps the
+        packed bytes and loads them as a read-only uint8 array."""
         self.dim = dim
         self.dtype = dtype
         self.dbname = dbname
@@ -32,15 +67,243 @@ class MilvusField(JSONField):
         self.nprobe = nprobe
         self.metric_type = metric_type
         self.index_type = index_type
+        self.index_params = index_params
+        self.search_params = search_params
+        self.storage = storage or self.get_default_storage()
         super().__init__(*args, **kwargs)
 
+    def check(self, **kwargs: Any) -> List[checks.CheckMessage]:
+        errors = super().check(**kwargs)
+        try:
+            self.get_search_params()
+            self.get_storage_dtype()
+            self.get_index_spec().validate_dtype(self.dtype)
+            if self.is_binary and self.dim % 8 != 0:
+                raise ValueError(
+                    f"dim ({self.dim}) of binary vectors must be a multiple of 8"
+                )
+            self.get_index_spec().validate_metric(self.metric_type)
+        except ValueError as e:
+            errors.append(checks.Error(str(e), obj=self, id="django_milvus.E001"))
+        return errors
+
+    def contribute_to_class(self, cls: Type[Model], name: str, **kwargs: Any) -> None:
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            # One receiver per model, no matter how many MilvusFields it has.
+            post_delete.connect(
+                delete_entry_on_model_delete,
+                sender=cls,
+                dispatch_uid="django_milvus_delete_entry",
+            )
+            post_save.connect(
+                sync_entry_on_model_save,
+                sender=cls,
+                dispatch_uid="django_milvus_sync_entry",
+            )
+
+    def get_internal_type(self) -> str:
+        if self.storage == "json":
+            return super().get_internal_type()
+        return "BinaryField"
+
+    @property
+    def is_binary(self) -> bool:
+        return self.dtype == DataType.BINARY_VECTOR
+
+    def get_default_storage(self) -> str:
+        return PACKED_STORAGE if self.is_binary else "json"
+
+    def get_storage_dtype(self) -> Optional[np.dtype]:
+        """Returns the dtype of the binary storage, None for json."""
+        if self.storage == "json":
+            return None
+        if self.is_binary:
+            if self.storage != PACKED_STORAGE:
+                raise ValueError(
+                    f"Binary vectors can't be stored as {self.storage}, "
+                    f"expected json or {PACKED_STORAGE}"
+                )
+            return np.dtype(np.uint8)
+        try:
+            return STORAGE_DTYPES[self.storage]
+        except KeyError:
+            raise ValueError(
+                f"Unknown storage: {self.storage}, expected json or one of "
+                f"{sorted(STORAGE_DTYPES)}"
+            )
+
+    def get_prep_value(self, value: Any) -> Any:
+        dtype = self.get_storage_dtype()
+        if dtype is None:
+            if isinstance(value, BytesLike):
+                value = list(bytes(value))
+            elif isinstance(value, np.ndarray):
+                value = value.tolist()
+            return super().get_prep_value(value)
+        if value is None:
+            return None
+        if self.is_binary:
+            return self.pack_bits([value]).tobytes()
+        return np.asarray(value, dtype=dtype).tobytes()
+
+    def get_db_prep_value(
+        self, value: Any, connection: Any, prepared: bool = False
+    ) -> Any:
+        value = super().get_db_prep_value(value, connection, prepared)
+        if self.storage != "json" and value is not None:
+            return connection.Database.Binary(value)
+        return value
+
+    def from_db_value(self, value: Any, expression: Any, connection: Any) -> Any:
+        dtype = self.get_storage_dtype()
+        if dtype is None:
+            return super().from_db_value(value, expression, connection)
+        if value is None:
+            return None
+        array = np.frombuffer(value, dtype=dtype)
+        # Some drivers return writable buffers, the rows must not be edited
+        # in place.
+        array.flags.writeable = False
+        return array
+
+    def value_to_string(self, obj: Model) -> Any:
+        value = self.value_from_object(obj)
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        return value
+
+    def clean(self, value: Any, model_instance: Optional[Model]) -> Any:
+        if isinstance(value, np.ndarray):
+            # The json and empty value checks don't support arrays.
+            super().clean(value.tolist(), model_instance)
+            return value
+        return super().clean(value, model_instance)
+
     def get_connection_class(self) -> Type["Connection"]:
         from .connection import Connection
 
         return Connection
 
     def get_connection(self) -> Connection:
-        return self.get_connection_class()(self.dbname)
+        """Returns the connected Connection of this process, see
+        django_milvus.registry."""
+        from .registry import connections
+
+        return connections.get(self.dbname, self.get_connection_class())
+
+    def get_milvus_array(self, values: Sequence[Any]) -> np.ndarray:
+        """Stacks a column of vectors into a contiguous (n, dim) array, or a
+        (n, dim / 8) array of packed bits for binary vectors."""
+        if self.is_binary:
+            return self.pack_bits(values)
+        return np.ascontiguousarray(values, dtype=np.float32).reshape(
+            len(values), self.dim
+        )
+
+    def get_insert_values(self, array: np.ndarray) -> Any:
+        """Converts an array of get_milvus_array() to what collection.insert()
+        receives for this field: binary vectors are sent as bytes."""
+        if self.is_binary:
+            return [row.tobytes() for row in array]
+        return array
+
+    def pack_bits(self, values: Sequence[Any]) -> np.ndarray:
+        """Returns binary vectors, each either dim bits or dim / 8 bytes of
+        packed bits, as a (n, dim / 8) uint8 array."""
+        width = self.dim // 8
+        if all(isinstance(value, BytesLike) for value in values):
+            array = np.frombuffer(b"".join(values), dtype=np.uint8)
+        else:
+            try:
+                array = np.asarray(values)
+            except ValueError:
+                array = np.empty(0)
+            if array.ndim != 2 and len(values) > 1:
+                # Vectors given in different forms, pack them one at a time.
+                return np.concatenate([self.pack_bits([value]) for value in values])
+            if array.ndim == 2 and array.shape[1] == self.dim:
+                array = np.packbits(array.astype(bool), axis=1)
+            elif array.ndim == 2 and array.shape[1] == width:
+                array = array.astype(np.uint8, copy=False)
+        if array.size != len(values) * width:
+            raise ValueError(
+                f"Expected binary vectors of {self.dim} bits or {width} bytes"
+            )
+        return np.ascontiguousarray(array).reshape(len(values), width)
+
+    def get_invalid_vectors(self, values: Sequence[Any]) -> Dict[int, str]:
+        """Returns {index: reason} for the vectors of a column that milvus
+        can't store: missing, of another dim or with values that are not
+        finite. A column without any, the common case, is checked with a few
+        vectorized operations; rows are only checked one by one otherwise."""
+        if self.is_binary:
+            try:
+                self.pack_bits(values)
+                return {}
+            except (ValueError, TypeError):
+                pass
+            invalid = {}
+            for i, value in enumerate(values):
+                try:
+                    self.pack_bits([value])
+                except (ValueError, TypeError) as e:
+                    invalid[i] = str(e)
+            return invalid
+        # Values too large for float32 become inf, and are reported as such.
+        with np.errstate(over="ignore"):
+            try:
+                array = np.asarray(values, dtype=np.float32)
+            except (ValueError, TypeError):
+                array = None
+        if array is not None and array.shape == (len(values), self.dim):
+            rows = np.flatnonzero(~np.isfinite(array).all(axis=1))
+            return {int(i): "values must be finite" for i in rows}
+        invalid = {}
+        for i, value in enumerate(values):
+            try:
+                with np.errstate(over="ignore"):
+                    row = np.asarray(value, dtype=np.float32)
+            except (ValueError, TypeError):
+                invalid[i] = "expected a vector of numbers"
+                continue
+            if row.shape != (self.dim,):
+                invalid[i] = f"expected {self.dim} values, got shape {row.shape}"
+            elif not np.isfinite(row).all():
+                invalid[i] = "values must be finite"
+        return invalid
+
+    def get_index_spec(self) -> IndexSpec:
+        return get_index_spec(self.index_type)
+
+    def get_index_params(self) -> Dict[str, Any]:
+        """Returns the validated params to build the index with."""
+        spec = self.get_index_spec()
+        params = {"nlist": self.nlist} if "nlist" in spec.build_params else {}
+        params.update(self.index_params or {})
+        return spec.get_build_params(params, self.dim)
+
+    def get_search_params(
+        self, overrides: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Returns the validated params to search the index with. overrides
+        (see django_milvus.params) replace the declared params; the ones the
+        index type doesn't use are ignored, so that a single override block
+        can cover fields with different indexes."""
+        spec = self.get_index_spec()
+        params = {"nprobe": self.nprobe} if "nprobe" in spec.search_params else {}
+        params.update(self.search_params or {})
+        params.update(
+            {k: v for k, v in (overrides or {}).items() if k in spec.search_params}
+        )
+        return spec.get_search_params(params, self.get_index_params())
+
+    def get_search_vectors(self, vectors: Sequence[Any]) -> List[Any]:
+        """Converts query vectors (lists or arrays) to what collection.search()
+        receives for this field."""
+        if self.is_binary:
+            return self.get_insert_values(self.pack_bits(vectors))
+        return np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim).tolist()
 
     def deconstruct(self):
         name, path, args, kwargs = super().deconstruct()
@@ -55,17 +318,19 @@ class MilvusField(JSONField):
                 "index_type": self.index_type,
             }
         )
+        # Only when set, so that existing migrations don't change.
+        if self.index_params is not None:
+            kwargs["index_params"] = self.index_params
+        if self.search_params is not None:
+            kwargs["search_params"] = self.search_params
+        if self.storage != self.get_default_storage():
+            kwargs["storage"] = self.storage
         return name, path, args, kwargs
 
     def get_lookup(self, lookup_name: str) -> Type[Lookup] | None:
         if lookup_name.startswith("nearest"):
             try:
-                return get_nearest_n(
-                    int(lookup_name[8:]),
-                    self.model,
-                    self,
-                    self.get_connection(),
-                )
+                return get_nearest_n(int(lookup_name[8:]), self.model, self)
             except ValueError:
                 raise ValueError(
                     "incorrect syntax when looking up nearby vectors: use nearest_{int}. got {lookup_name}"
@@ -0,0 +1,220 @@
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional, Sequence, Set, Tuple, Type
+
+from django.db.models import Model, Q
+from pymilvus import DataType
+
+from django_milvus.options import MilvusOptions, get_milvus_options
+
+_search_filters: ContextVar[
+    Optional[Tuple[Type[Model], Tuple[Q, ...], Optional[str]]]
+] = ContextVar("django_milvus_search_filters", default=None)
+
+
+@contextmanager
+def search_filters(
+    model: Type[Model], filters: Sequence[Q], using: Optional[str] = None
+) -> Iterator[None]:
+    """Within the block, searches of model's collection only need to return
+    rows matching all of filters, in the database using. Set by
+    MilvusQuerySet, with the filters and the database of the queryset so
+    far."""
+    token = _search_filters.set((model, tuple(filters), using))
+    try:
+        yield
+    finally:
+        _search_filters.reset(token)
+
+
+def get_search_filters(model: Type[Model]) -> Tuple[Q, ...]:
+    current = _search_filters.get()
+    if current is None or current[0] is not model:
+        return ()
+    return current[1]
+
+
+def get_search_database(model: Type[Model]) -> Optional[str]:
+    """Returns the database the filters in effect are applied in, None for
+    the default one."""
+    current = _search_filters.get()
+    if current is None or current[0] is not model:
+        return None
+    return current[2]
+
+
+def get_filtered_partition_names(model: Type[Model]) -> Optional[Set[str]]:
+    """Returns the names of the partitions holding the rows that match the
+    filters in effect, or None if they don't restrict the partition field."""
+    options = get_milvus_options(model)
+    if options.partition_field is None:
+        return None
+    names: Optional[Set[str]] = None
+    for q in get_search_filters(model):
+        found = get_partition_names(q, options)
+        if found is not None:
+            names = found if names is None else names & found
+    return names
+
+
+def get_partition_names(node: Any, options: MilvusOptions) -> Optional[Set[str]]:
+    """Returns the partitions that rows matching a Q node can be in. Only
+    exact and in lookups of the partition field, combined with AND and OR,
+    restrict them."""
+    field = options.partition_field
+    assert field is not None
+    if isinstance(node, tuple):
+        key, value = node
+        name, _, lookup = key.partition("__")
+        if name not in (field.name, field.attname) or hasattr(
+            value, "resolve_expression"
+        ):
+            return None
+        if lookup in ("", "exact"):
+            return {options.get_partition_name(value)}
+        if lookup == "in":
+            return {options.get_partition_name(v) for v in value}
+        return None
+    if not isinstance(node, Q) or node.negated:
+        return None
+    found = [get_partition_names(child, options) for child in node.children]
+    if node.connector == Q.OR:
+        if not found or any(names is None for names in found):
+            return None
+        return set().union(*found)  # type: ignore
+    restricted = [names for names in found if names is not None]
+    if not restricted:
+        return None
+    return set.intersection(*restricted)
+
+
+COMPARISONS = {
+    "": "==",
+    "exact": "==",
+    "lt": "<",
+    "lte": "<=",
+    "gt": ">",
+    "gte": ">=",
+}
+
+
+def get_filter_expr(model: Type[Model]) -> Optional[str]:
+    """Compiles the filters in effect into a milvus boolean expression over
+    the mirror fields of the model, or returns None if none of them can be.
+
+    Supported are the exact, lt, lte, gt, gte and in lookups of the mirror
+    fields, combined with AND, OR and NOT. Conditions that can't be compiled
+    are left out of an AND, which returns more rows than needed but never
+    less: the database still applies every filter. An OR or a NOT with such
+    a condition is left out as a whole."""
+    options = get_milvus_options(model)
+    if not options.mirror_fields:
+        return None
+    exprs = [compile_node(q, options, strict=False) for q in get_search_filters(model)]
+    exprs = [expr for expr in exprs if expr is not None]
+    if not exprs:
+        return None
+    return join_exprs(exprs, " and ")
+
+
+def compile_node(node: Any, options: MilvusOptions, strict: bool) -> Optional[str]:
+    """Compiles a Q node, None if it can't be. When strict, an AND can't
+    leave anything out, which is the case under a NOT."""
+    if isinstance(node, tuple):
+        return compile_lookup(*node, options=options)
+    if not isinstance(node, Q):
+        return None
+    # Leaving a condition out of an AND under a NOT would exclude rows that
+    # match: not (a and b) is true for more rows than not a.
+    strict = strict or node.negated
+    exprs = [compile_node(child, options, strict) for child in node.children]
+    if node.connector == Q.AND and not strict:
+        exprs = [expr for expr in exprs if expr is not None]
+    if not exprs or any(expr is None for expr in exprs):
+        return None
+    connector = " and " if node.connector == Q.AND else " or "
+    expr = join_exprs(exprs, connector)  # type: ignore
+    return f"not ({expr})" if node.negated else expr
+
+
+def join_exprs(exprs: Sequence[str], connector: str) -> str:
+    if len(exprs) == 1:
+        return exprs[0]
+    return connector.join(f"({expr})" for expr in exprs)
+
+
+def compile_lookup(key: str, value: Any, options: MilvusOptions) -> Optional[str]:
+    name, _, lookup = key.partition("__")
+    fields = [f for f in options.mirror_fields if name in (f.name, f.attname)]
+    if not fields or hasattr(value, "resolve_expression"):
+        return None
+    field = fields[0]
+    if lookup == "in":
+        values = [format_value(field, v) for v in value]
+        if not values or None in values:
+            return None
+        return f"{field.attname} in [{', '.join(values)}]"  # type: ignore
+    if (
+        lookup in ("lt", "gte")
+        and isinstance(value, float)
+        and options.get_mirror_dtype(field) == DataType.INT64
+    ):
+        # Like django's IntegerFieldFloatRounding: qty < 1.5 is qty < 2.
+        value = math.ceil(value)
+    formatted = format_value(field, value)
+    if lookup not in COMPARISONS or formatted is None:
+        return None
+    return f"{field.attname} {COMPARISONS[lookup]} {formatted}"
+
+
+def format_value(field: Any, value: Any) -> Optional[str]:
+    """Returns value as a milvus literal, None for values that can't be
+    compared in milvus."""
+    if isinstance(value, Model):
+        value = value.pk
+    if field.is_relation:
+        value = field.target_field.get_prep_value(value)
+    else:
+        value = field.get_prep_value(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float) and math.isfinite(value):
+        return repr(value)
+    return None
+
+
+def get_sql_filters(model: Type[Model]) -> Optional[List[Q]]:
+    """Returns the filters in effect without their nearest lookups, to find
+    which search results the database keeps. Returns None if a nearest
+    lookup is under an OR or a NOT, it can't be left out then."""
+    try:
+        filters = [strip_nearest(q, strict=False) for q in get_search_filters(model)]
+    except ValueError:
+        return None
+    return [q for q in filters if q is not None]
+
+
+def strip_nearest(node: Any, strict: bool) -> Any:
+    """Returns node without its nearest lookups, None if nothing is left."""
+    if isinstance(node, tuple):
+        is_nearest = any(part.startswith("nearest_") for part in node[0].split("__"))
+        return None if is_nearest else node
+    if not isinstance(node, Q):
+        return node
+    strict = strict or node.negated or node.connector != Q.AND
+    children = []
+    for child in node.children:
+        stripped = strip_nearest(child, strict)
+        if stripped is None:
+            if strict:
+                raise ValueError("A nearest lookup can't be left out here")
+            continue
+        children.append(stripped)
+    if not children:
+        return None
+    q = Q(*children)
+    q.connector, q.negated = node.connector, node.negated
+    return q
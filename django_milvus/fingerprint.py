@@ -0,0 +1,45 @@
+from typing import Sequence
+
+import numpy as np
+
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def get_fingerprints(arrays: Sequence[np.ndarray]) -> np.ndarray:
+    """Returns an int64 hash of each row of the given (n, ...) arrays, such as
+    the insert columns of the MilvusFields of a batch. Rows hash the same if
+    and only if (barring collisions) their bytes are the same.
+
+    The rows are hashed 8 bytes at a time, in a loop over the columns that is
+    vectorized over the rows: FNV-1a with a xorshift, so that the high bytes
+    of each word also reach the low bits of the hash."""
+    n = len(arrays[0]) if arrays else 0
+    hashes = np.full(n, FNV_OFFSET, dtype=np.uint64)
+    if n == 0:
+        return hashes.view(np.int64)
+    rows = np.concatenate(
+        [np.ascontiguousarray(a).view(np.uint8).reshape(n, -1) for a in arrays],
+        axis=1,
+    )
+    padding = -rows.shape[1] % 8
+    if padding:
+        rows = np.pad(rows, ((0, 0), (0, padding)))
+    words = np.ascontiguousarray(rows).view("<u8")
+    for j in range(words.shape[1]):
+        hashes ^= words[:, j]
+        hashes *= FNV_PRIME
+        hashes ^= hashes >> np.uint64(29)
+    return hashes.view(np.int64)
+
+
+def get_label_fingerprints(labels: Sequence[str]) -> np.ndarray:
+    """Returns an int64 hash of each of the given strings, such as the
+    partition names of a batch, as a column for get_fingerprints(). Each
+    distinct string is hashed once."""
+    unique, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    hashes = [
+        get_fingerprints([np.frombuffer(label.encode(), dtype=np.uint8)[None]])[0]
+        for label in unique
+    ]
+    return np.asarray(hashes, dtype=np.int64)[inverse]
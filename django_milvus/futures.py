@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+def get_grpc_future(future: Any) -> Any:
+    """Returns the grpc future under a pymilvus future, or None. The futures
+    of pymilvus.Collection (pymilvus.orm) keep a pymilvus.client future in
+    _f, which keeps the grpc call in _future."""
+    client_future = getattr(future, "_f", future)
+    grpc_future = getattr(client_future, "_future", None)
+    if hasattr(grpc_future, "add_done_callback"):
+        return grpc_future
+    return None
+
+
+async def await_milvus_future(future: Any) -> Any:
+    """Awaits a pymilvus future, as returned by the _async=True variants of
+    search/insert/delete, without blocking the event loop or using a thread,
+    and returns its result() or raises its error.
+
+    Futures without a grpc call to wait on are waited on in the default
+    executor. Anything that is not a future is assumed to be a result
+    already."""
+    if not callable(getattr(future, "result", None)):
+        return future
+    grpc_future = get_grpc_future(future)
+    if grpc_future is None:
+        return await run_blocking(future.result)
+    loop = asyncio.get_running_loop()
+    waiter = loop.create_future()
+
+    def set_result() -> None:
+        # Runs in the event loop. The grpc call is complete at this point, so
+        # result() returns immediately.
+        if waiter.done():
+            return
+        try:
+            waiter.set_result(future.result())
+        except Exception as e:
+            waiter.set_exception(e)
+
+    # grpc calls done callbacks from its own thread, or right away if the call
+    # has completed already.
+    grpc_future.add_done_callback(lambda *args: loop.call_soon_threadsafe(set_result))
+    return await waiter
+
+
+async def run_blocking(func: Callable[..., T], *args: Any) -> T:
+    """Runs a blocking call, such as establishing a connection, in the default
+    executor. Only used for one-off calls, never once per request."""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
@@ -0,0 +1,137 @@
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from pymilvus import DataType
+
+FLOAT_METRICS = ("L2", "IP")
+BINARY_METRICS = ("HAMMING", "JACCARD", "TANIMOTO")
+
+
+class IndexParam:
+    """An integer index or search param, and the range milvus accepts."""
+
+    def __init__(
+        self, name: str, min_value: int, max_value: int, default: Optional[int]
+    ) -> None:
+        self.name = name
+        self.min_value = min_value
+        self.max_value = max_value
+        self.default = default
+
+    def validate(self, value: Any) -> None:
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"{self.name} must be an integer, got {value!r}")
+        if not self.min_value <= value <= self.max_value:
+            raise ValueError(
+                f"{self.name} must be in [{self.min_value}, {self.max_value}], "
+                f"got {value}"
+            )
+
+
+class IndexSpec:
+    """Describes an index type: the params needed to build it, the params
+    accepted when searching it, and the metrics it supports."""
+
+    def __init__(
+        self,
+        name: str,
+        build_params: Sequence[IndexParam] = (),
+        search_params: Sequence[IndexParam] = (),
+        metrics: Tuple[str, ...] = FLOAT_METRICS,
+    ) -> None:
+        self.name = name
+        self.build_params = {p.name: p for p in build_params}
+        self.search_params = {p.name: p for p in search_params}
+        self.metrics = metrics
+
+    def get_build_params(self, params: Dict[str, Any], dim: int) -> Dict[str, Any]:
+        """Validates params and fills in the defaults of the missing ones."""
+        params = self.resolve(self.build_params, params, "index")
+        if "m" in params and dim % params["m"] != 0:
+            raise ValueError(f"dim ({dim}) must be divisible by m ({params['m']})")
+        return params
+
+    def get_search_params(
+        self, params: Dict[str, Any], build_params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        params = self.resolve(self.search_params, params, "search")
+        if "nprobe" in params and "nlist" in build_params:
+            params["nprobe"] = min(params["nprobe"], build_params["nlist"])
+        return params
+
+    def validate_metric(self, metric_type: str) -> None:
+        if metric_type not in self.metrics:
+            raise ValueError(
+                f"{self.name} supports the metrics {list(self.metrics)}, "
+                f"got {metric_type}"
+            )
+
+    def validate_dtype(self, dtype: DataType) -> None:
+        """Binary vectors need a binary index, float vectors a float one."""
+        binary = self.metrics == BINARY_METRICS
+        if binary != (dtype == DataType.BINARY_VECTOR):
+            raise ValueError(f"{self.name} can't index {dtype.name} fields")
+
+    def resolve(
+        self, specs: Dict[str, IndexParam], params: Dict[str, Any], kind: str
+    ) -> Dict[str, Any]:
+        unknown = set(params) - set(specs)
+        if unknown:
+            raise ValueError(
+                f"Unknown {kind} params for {self.name}: {sorted(unknown)}, "
+                f"expected some of {sorted(specs)}"
+            )
+        resolved = {}
+        for name, spec in specs.items():
+            value = params.get(name, spec.default)
+            if value is None:
+                raise ValueError(f"{self.name} requires the {kind} param {name}")
+            spec.validate(value)
+            resolved[name] = value
+        return resolved
+
+
+def nlist(default: int = 1024) -> IndexParam:
+    return IndexParam("nlist", 1, 65536, default)
+
+
+def nprobe(default: int = 32) -> IndexParam:
+    return IndexParam("nprobe", 1, 65536, default)
+
+
+INDEX_SPECS: Dict[str, IndexSpec] = {
+    spec.name: spec
+    for spec in [
+        IndexSpec("FLAT"),
+        IndexSpec("IVF_FLAT", [nlist()], [nprobe()]),
+        IndexSpec("IVF_SQ8", [nlist()], [nprobe()]),
+        IndexSpec(
+            "IVF_PQ",
+            [nlist(), IndexParam("m", 1, 65536, None), IndexParam("nbits", 1, 16, 8)],
+            [nprobe()],
+        ),
+        IndexSpec(
+            "HNSW",
+            [IndexParam("M", 4, 64, 16), IndexParam("efConstruction", 8, 512, 200)],
+            # ef must also be at least the limit of the search, see
+            # Connection.get_search_kwargs().
+            [IndexParam("ef", 1, 32768, 64)],
+        ),
+        IndexSpec(
+            "ANNOY",
+            [IndexParam("n_trees", 1, 1024, 8)],
+            [IndexParam("search_k", -1, 65536, -1)],
+        ),
+        IndexSpec("BIN_FLAT", metrics=BINARY_METRICS),
+        IndexSpec("BIN_IVF_FLAT", [nlist()], [nprobe()], metrics=BINARY_METRICS),
+    ]
+}
+
+
+def get_index_spec(index_type: str) -> IndexSpec:
+    try:
+        return INDEX_SPECS[index_type]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported index type: {index_type}, expected one of "
+            f"{sorted(INDEX_SPECS)}"
+        )
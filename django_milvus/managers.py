@@ -0,0 +1,294 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
+
+from asgiref.sync import sync_to_async
+from django.db import connections as db_connections
+from django.db import transaction
+from django.db.models import (
+    AutoField,
+    Case,
+    FloatField,
+    IntegerField,
+    Manager,
+    Max,
+    Model,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.query import QuerySet
+
+from django_milvus.connection import DEFAULT_SEARCH_BATCH_SIZE
+from django_milvus.fields import MilvusField
+from django_milvus.filters import search_filters
+from django_milvus.options import get_milvus_options
+from django_milvus.params import record_search_rounds, search_params
+from django_milvus.registry import connections
+from django_milvus.signals import collect_deletes, delete_entries_on_commit
+from django_milvus.utils import (
+    bulk_insert_instances,
+    bulk_update_instances,
+    update_entries,
+)
+
+logger = logging.getLogger("django_milvus")
+
+# bulk_update() is implemented with update(), which must not mirror the rows a
+# second time.
+_in_bulk_update: ContextVar[bool] = ContextVar(
+    "django_milvus_in_bulk_update", default=False
+)
+
+
+def has_auto_pks(model: Type[Model], objs: Sequence[Model]) -> bool:
+    """Whether the pks of objs are all left to the database to increment."""
+    pk_field = model._meta.pk
+    return (
+        bool(objs)
+        and isinstance(pk_field, AutoField)
+        and all(obj.pk is None for obj in objs)
+    )
+
+
+class MilvusQuerySet(QuerySet):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._milvus_search_params: Dict[str, Any] = {}
+        # The filters so far, that searches can restrict themselves to.
+        self._milvus_filters: Tuple[Q, ...] = ()
+        # The number of rounds of each nearest search of this queryset, more
+        # than one for adaptive searches that had to search again.
+        self.milvus_search_rounds: Tuple[int, ...] = ()
+
+    def _clone(self) -> "MilvusQuerySet":
+        clone = super()._clone()  # type: ignore
+        clone._milvus_search_params = self._milvus_search_params
+        clone._milvus_filters = self._milvus_filters
+        clone.milvus_search_rounds = self.milvus_search_rounds
+        return clone
+
+    def _filter_or_exclude(self, negate: bool, args: Any, kwargs: Any) -> Any:
+        # nearest lookups search milvus while the filter is being built, with
+        # the filters before them and the ones in the same call.
+        q = Q(*args, **kwargs)
+        filters = (*self._milvus_filters, ~q if negate else q)
+        with self.search_context(filters) as rounds:
+            clone = super()._filter_or_exclude(negate, args, kwargs)
+        clone._milvus_filters = filters
+        clone.milvus_search_rounds += tuple(rounds)
+        return clone
+
+    @contextmanager
+    def search_context(
+        self, filters: Optional[Tuple[Q, ...]] = None
+    ) -> Iterator[List[int]]:
+        """Applies the search params and the filters of this queryset to the
+        searches in the block, and collects their number of rounds."""
+        if filters is None:
+            filters = self._milvus_filters
+        with search_params(**self._milvus_search_params):
+            with search_filters(self.model, filters, self.db):
+                with record_search_rounds() as rounds:
+                    yield rounds
+
+    def search_params(self, **params: Any) -> "MilvusQuerySet":
+        """Overrides the search params (nprobe, ef, search_k, overfetch,
+        adaptive, max_limit) of the nearest lookups and searches that follow
+        on this queryset:
+
+            Product.objects.search_params(nprobe=4).filter(
+                similarity__nearest_10=vector
+            )
+
+        See django_milvus.params.search_params()."""
+        with search_params(**params):
+            pass  # validates the params
+        clone = self._chain()  # type: ignore
+        clone._milvus_search_params = {**self._milvus_search_params, **params}
+        return clone
+
+    def bulk_create(
+        self, objs: Iterable[Model], *args: Any, **kwargs: Any
+    ) -> List[Model]:
+        """Also inserts the created rows into milvus, one insert per batch, once
+        the transaction commits.
+
+        Only PostgreSQL sets the pks of the created objects, and not with
+        ignore_conflicts=True. Otherwise, auto-incremented rows are read back
+        as the ones above the highest pk before the insert. Rows whose pk is
+        still unknown are left out with a warning, until rebuild_index()."""
+        objs = list(objs)
+        features = db_connections[self.db].features
+        if (
+            not features.can_return_rows_from_bulk_insert
+            or kwargs.get("ignore_conflicts")
+        ) and has_auto_pks(self.model, objs):
+            with transaction.atomic(using=self.db, savepoint=False):
+                last_pk = self.model._base_manager.db_manager(self.db).aggregate(
+                    last_pk=Max("pk")
+                )["last_pk"]
+                objs = super().bulk_create(objs, *args, **kwargs)
+                created = self.model._base_manager.db_manager(self.db).all()
+                if last_pk is not None:
+                    created = created.filter(pk__gt=last_pk)
+                pks = list(created.values_list("pk", flat=True))
+            self.on_commit(lambda: update_entries(self.model, pks))
+            return objs
+        objs = super().bulk_create(objs, *args, **kwargs)
+        missing = sum(obj.pk is None for obj in objs)
+        if missing:
+            logger.warning(
+                "Left %d rows created by bulk_create() out of milvus, their pks "
+                "are unknown",
+                missing,
+            )
+        self.on_commit(lambda: bulk_insert_instances(self.model, objs))
+        return objs
+
+    def bulk_update(
+        self, objs: Iterable[Model], fields: Sequence[str], *args: Any, **kwargs: Any
+    ) -> Any:
+        """Also replaces the rows in milvus, when a field stored in milvus is
+        among the updated fields, see get_milvus_field_names()."""
+        objs = list(objs)
+        token = _in_bulk_update.set(True)
+        try:
+            result = super().bulk_update(objs, fields, *args, **kwargs)
+        finally:
+            _in_bulk_update.reset(token)
+        if self.get_milvus_field_names() & set(fields):
+            self.on_commit(lambda: bulk_update_instances(self.model, objs))
+        return result
+
+    def update(self, **kwargs: Any) -> int:
+        """Also replaces the updated rows in milvus, when a field stored in
+        milvus is updated. The new values are read back in batches."""
+        if _in_bulk_update.get() or not self.get_milvus_field_names() & set(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            pks = list(self.values_list("pk", flat=True))
+            rows = super().update(**kwargs)
+        self.on_commit(lambda: update_entries(self.model, pks))
+        return rows
+
+    def delete(self) -> Any:
+        """Also deletes the vectors of the deleted rows, including the ones
+        deleted by cascade, with batched deletes instead of one per row."""
+        with collect_deletes() as deleted:
+            result = super().delete()
+        for model, pks in deleted.items():
+            delete_entries_on_commit(model, pks, using=self.db)
+        return result
+
+    def on_commit(self, func: Any) -> None:
+        transaction.on_commit(func, using=self.db)
+
+    def get_milvus_field_names(self) -> Set[str]:
+        """The names of the fields stored in milvus: the MilvusFields, and
+        the mirror and partition fields of MilvusMeta."""
+        fields = self.model._meta.get_fields()
+        names = {f.name for f in fields if isinstance(f, MilvusField)}
+        options = get_milvus_options(self.model)
+        for field in [*options.mirror_fields, options.partition_field]:
+            if field is not None:
+                names |= {field.name, field.attname}
+        return names
+
+    def nearest(self, field_name: str, vector: Any, k: int) -> "MilvusQuerySet":
+        """Returns the k rows nearest to vector, in the rank order of the
+        search, annotated with their `distance` and `nearest_rank`. Both are
+        computed from the search result, so this is one search and one SQL
+        query."""
+        field = self.get_milvus_field(field_name)
+        with self.search_context() as rounds:
+            pks, distances = field.get_connection().search_nearest(
+                self.model, field, vector, k
+            )
+        queryset = self.rank_by_search(pks, distances)
+        queryset.milvus_search_rounds += tuple(rounds)
+        return queryset
+
+    async def anearest(self, field_name: str, vector: Any, k: int) -> List[Model]:
+        """Async version of nearest(), returns the ranked rows. The search
+        runs on the event loop; the SQL query uses the async ORM when django
+        has one, sync_to_async otherwise."""
+        field = self.get_milvus_field(field_name)
+        connection = await connections.aget(field.dbname, field.get_connection_class())
+        with self.search_context():
+            pks, distances = await connection.asearch_nearest(
+                self.model, field, vector, k
+            )
+        queryset = self.rank_by_search(pks, distances)
+        if hasattr(queryset, "__aiter__"):
+            return [row async for row in queryset]
+        return await sync_to_async(list)(queryset)
+
+    def nearest_many(
+        self,
+        field_name: str,
+        vectors: Sequence[Any],
+        k: int,
+        batch_size: int = DEFAULT_SEARCH_BATCH_SIZE,
+    ) -> Dict[int, List[Model]]:
+        """Searches the k nearest rows of every vector, batch_size vectors per
+        search request. Returns {index of the vector: ranked rows}. All rows
+        are fetched with a single SQL query; a row that matches several
+        vectors is the same instance in each list."""
+        field = self.get_milvus_field(field_name)
+        connection = field.get_connection()
+        hits: List[List[Any]] = []
+        with self.search_context():
+            for start in range(0, len(vectors), batch_size):
+                batch = vectors[start : start + batch_size]
+                results = connection.search(self.model, field, batch, k)
+                hits.extend(pks for pks, _ in results)
+        rows = self.in_bulk({pk for pks in hits for pk in pks})
+        return {i: [rows[pk] for pk in pks if pk in rows] for i, pks in enumerate(hits)}
+
+    def rank_by_search(
+        self, pks: List[Any], distances: List[float]
+    ) -> "MilvusQuerySet":
+        if not pks:
+            return self.none()
+        return (
+            self.filter(pk__in=pks)
+            .annotate(**self.get_rank_annotations(pks, distances))
+            .order_by("nearest_rank")
+        )
+
+    def get_rank_annotations(
+        self, pks: List[Any], distances: List[float]
+    ) -> Dict[str, Case]:
+        return {
+            "distance": Case(
+                *[When(pk=pk, then=Value(d)) for pk, d in zip(pks, distances)],
+                output_field=FloatField(),
+            ),
+            "nearest_rank": Case(
+                *[When(pk=pk, then=Value(i)) for i, pk in enumerate(pks)],
+                output_field=IntegerField(),
+            ),
+        }
+
+    def get_milvus_field(self, field_name: str) -> MilvusField:
+        field = self.model._meta.get_field(field_name)
+        if not isinstance(field, MilvusField):
+            raise ValueError(f"{field_name} is not a MilvusField")
+        return field
+
+
+class MilvusManager(Manager.from_queryset(MilvusQuerySet)):  # type: ignore
+    pass
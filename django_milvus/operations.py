@@ -0,0 +1,125 @@
+from typing import Any, Tuple
+
+from django.db.migrations import AddField, AlterField, RemoveField, RenameField
+from django.db.migrations.state import ProjectState
+from django.db.models import Field
+
+DEFAULT_CONVERT_BATCH_SIZE = 1000
+
+
+class ConvertMilvusFieldStorage(AlterField):
+    """Alters a MilvusField like AlterField, converting the stored vectors
+    when its storage changes, for example from json to float32:
+
+        operations = [
+            ConvertMilvusFieldStorage(
+                model_name="product",
+                name="similarity",
+                field=MilvusField(dim=2, dtype=DataType.FLOAT_VECTOR, storage="float32"),
+            ),
+        ]
+
+    The converted vectors are written to a temporary column, batch_size rows
+    at a time, which then replaces the old one. Reversible."""
+
+    def __init__(
+        self,
+        model_name: str,
+        name: str,
+        field: Field,
+        batch_size: int = DEFAULT_CONVERT_BATCH_SIZE,
+    ) -> None:
+        self.batch_size = batch_size
+        super().__init__(model_name, name, field)
+
+    def deconstruct(self) -> Tuple[str, Any, Any]:
+        name, args, kwargs = super().deconstruct()
+        if self.batch_size != DEFAULT_CONVERT_BATCH_SIZE:
+            kwargs["batch_size"] = self.batch_size
+        return name, args, kwargs
+
+    def database_forwards(
+        self,
+        app_label: str,
+        schema_editor: Any,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        self.convert(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(
+        self,
+        app_label: str,
+        schema_editor: Any,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        self.convert(app_label, schema_editor, from_state, to_state)
+
+    def convert(
+        self,
+        app_label: str,
+        schema_editor: Any,
+        from_state: ProjectState,
+        to_state: ProjectState,
+    ) -> None:
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, to_model):
+            return
+        to_field = to_model._meta.get_field(self.name)
+        temp_name = f"{self.name}_converted"
+        # Nullable and without a default, so that adding it writes nothing.
+        _, path, args, kwargs = to_field.deconstruct()
+        kwargs.update(null=True)
+        kwargs.pop("default", None)
+        steps = [
+            AddField(self.model_name, temp_name, to_field.__class__(*args, **kwargs)),
+            RemoveField(self.model_name, self.name),
+            RenameField(self.model_name, temp_name, self.name),
+            AlterField(self.model_name, self.name, to_field),
+        ]
+        state = from_state
+        for i, step in enumerate(steps):
+            next_state = state.clone()
+            step.state_forwards(app_label, next_state)
+            step.database_forwards(app_label, schema_editor, state, next_state)
+            if i == 0:
+                self.copy_vectors(app_label, schema_editor, next_state, temp_name)
+            state = next_state
+
+    def copy_vectors(
+        self,
+        app_label: str,
+        schema_editor: Any,
+        state: ProjectState,
+        temp_name: str,
+    ) -> None:
+        """Copies the vectors to the temporary field, converted to its
+        storage."""
+        connection = schema_editor.connection
+        model = state.apps.get_model(app_label, self.model_name)
+        temp_field = model._meta.get_field(temp_name)
+        quote_name = schema_editor.quote_name
+        sql = "UPDATE {} SET {} = %s WHERE {} = %s".format(
+            quote_name(model._meta.db_table),
+            quote_name(temp_field.column),
+            quote_name(model._meta.pk.column),
+        )
+        rows = model._base_manager.using(connection.alias).order_by("pk")
+        rows = rows.values_list("pk", self.name)
+        last_pk = None
+        while True:
+            batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            chunk = list(batch[: self.batch_size])
+            if not chunk:
+                return
+            params = [
+                (
+                    temp_field.get_db_prep_value(vector, connection),
+                    model._meta.pk.get_db_prep_value(pk, connection),
+                )
+                for pk, vector in chunk
+            ]
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, params)
+            last_pk = chunk[-1][0]
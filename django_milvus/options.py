@@ -0,0 +1,133 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Type
+
+import numpy as np
+from django.db.models import Field, Model
+from django.utils.functional import cached_property
+from pymilvus import DataType
+
+from django_milvus.pk import (
+    INTEGER_FIELD_TYPES,
+    PK_STRATEGIES,
+    PkStrategy,
+    get_default_pk_strategy,
+)
+
+DEFAULT_PARTITION_NAME = "_default"
+
+# The scalar types milvus can store, by django internal type.
+MIRROR_DTYPES = {
+    **dict.fromkeys(INTEGER_FIELD_TYPES, DataType.INT64),
+    "FloatField": DataType.DOUBLE,
+    "BooleanField": DataType.BOOL,
+}
+NUMPY_DTYPES = {
+    DataType.INT64: np.int64,
+    DataType.DOUBLE: np.float64,
+    DataType.BOOL: np.bool_,
+}
+
+
+class MilvusOptions:
+    """The milvus options of a model, declared with an inner MilvusMeta class,
+    similar to Meta:
+
+        class Product(models.Model):
+            category = models.CharField(max_length=50)
+            similarity = MilvusField(dim=2)
+
+            class MilvusMeta:
+                partition_by = "category"
+                mirror_fields = ["price", "in_stock"]
+                pk_strategy = "varchar"
+
+    partition_by names a field whose values split the collection into
+    partitions, one per value. Searches filtered on that field (exact or in)
+    only search the matching partitions.
+
+    mirror_fields are stored in the collection next to the vectors, so that
+    filters on them are applied by the search itself, see
+    django_milvus.filters. Integer, float, boolean and foreign key fields can
+    be mirrored, as long as they are not nullable.
+
+    pk_strategy is how pks are stored, see django_milvus.pk: "int" for
+    integer pks, "varchar" for any pk on a milvus server that supports
+    VARCHAR primary keys (2.1 or later), or "uuid" for UUIDs on servers that
+    don't, at the risk of id collisions. Defaults to "int" for integer pks
+    and "varchar" otherwise, or "uuid" with pymilvus 2.0.
+    """
+
+    def __init__(self, model: Type[Model]) -> None:
+        self.model = model
+        meta = getattr(model, "MilvusMeta", None)
+        self.partition_by: Optional[str] = getattr(meta, "partition_by", None)
+        self.mirror_field_names: Sequence[str] = getattr(meta, "mirror_fields", ())
+        self.pk_strategy_name: Optional[str] = getattr(meta, "pk_strategy", None)
+
+    @cached_property
+    def partition_field(self) -> Optional[Field]:
+        if self.partition_by is None:
+            return None
+        return self.model._meta.get_field(self.partition_by)
+
+    @cached_property
+    def pk_strategy(self) -> PkStrategy:
+        pk_field = self.model._meta.pk
+        name = self.pk_strategy_name or get_default_pk_strategy(pk_field)
+        if name not in PK_STRATEGIES:
+            raise ValueError(
+                f"Unknown pk strategy: {name}, expected one of {sorted(PK_STRATEGIES)}"
+            )
+        return PK_STRATEGIES[name](pk_field)
+
+    @cached_property
+    def mirror_fields(self) -> List[Field]:
+        fields = [self.model._meta.get_field(name) for name in self.mirror_field_names]
+        for field in fields:
+            if field.primary_key or field.null:
+                raise ValueError(
+                    f"{field} can't be mirrored: primary keys are stored already "
+                    "and milvus doesn't support null values"
+                )
+            self.get_mirror_dtype(field)
+        return fields
+
+    def get_mirror_dtype(self, field: Field) -> DataType:
+        target = field.target_field if field.is_relation else field
+        try:
+            return MIRROR_DTYPES[target.get_internal_type()]
+        except KeyError:
+            raise ValueError(
+                f"{field} can't be mirrored, expected an integer, float, boolean "
+                "or foreign key field"
+            )
+
+    def get_mirror_array(self, field: Field, values: Sequence[Any]) -> np.ndarray:
+        return np.asarray(values, dtype=NUMPY_DTYPES[self.get_mirror_dtype(field)])
+
+    def get_scalar_attnames(self) -> List[str]:
+        """The attnames of the fields, other than the MilvusFields, whose
+        values are read along with the vectors when inserting."""
+        attnames = [f.attname for f in self.mirror_fields]
+        if self.partition_field and self.partition_field.attname not in attnames:
+            attnames.append(self.partition_field.attname)
+        return attnames
+
+    def get_partition_name(self, value: Any) -> str:
+        """Partition names are restricted to letters, digits and underscores,
+        other values are hashed."""
+        if value is None:
+            return DEFAULT_PARTITION_NAME
+        if isinstance(value, Model):
+            value = value.pk
+        text = str(value)
+        if re.fullmatch(r"\w{1,200}", text, re.ASCII):
+            return f"p_{text}"
+        return "h_" + hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_milvus_options(model: Type[Model]) -> MilvusOptions:
+    return MilvusOptions(model)
@@ -0,0 +1,148 @@
+import logging
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import django
+from django.apps import apps
+from django.db import connections as db_connections
+from django.db.models import Model
+from django.db.models.query import QuerySet
+from django.db.models.sql import Query
+
+from django_milvus.connection import DEFAULT_BATCH_SIZE, Connection
+from django_milvus.fields import MilvusField
+from django_milvus.registry import connections
+from django_milvus.validation import collect_rejected_rows, record_rejected_rows
+
+logger = logging.getLogger("django_milvus")
+
+# Each worker gets about this many slices, so that a slow one doesn't hold the
+# others up at the end.
+SLICES_PER_WORKER = 4
+
+PkSlice = Tuple[Optional[Any], Optional[Any]]
+
+
+def get_pk_slices(queryset: QuerySet, slice_size: int) -> List[PkSlice]:
+    """Splits the queryset into (lo, hi) pk ranges of slice_size rows, lo
+    included and hi excluded, None for an open end. Only the pk index is
+    read."""
+    pks = queryset.order_by("pk").values_list("pk", flat=True)
+    bounds = [pk for i, pk in enumerate(pks.iterator()) if i % slice_size == 0]
+    edges = [None, *bounds[1:], None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def filter_pk_slice(queryset: QuerySet, pk_slice: PkSlice) -> QuerySet:
+    lo, hi = pk_slice
+    if lo is not None:
+        queryset = queryset.filter(pk__gte=lo)
+    if hi is not None:
+        queryset = queryset.filter(pk__lt=hi)
+    return queryset
+
+
+def init_worker() -> None:
+    # Needed with the spawn start method, a no-op after a fork.
+    django.setup()
+
+
+def insert_pk_slice(
+    label: str,
+    query: Query,
+    dbname: str,
+    collection_name: str,
+    pk_slice: PkSlice,
+    batch_size: int,
+) -> Tuple[int, Dict[Any, str]]:
+    """Runs in a worker: reads, encodes and inserts the rows of one slice.
+    Returns the number of inserted rows and the rejected ones, which the
+    parent records, see django_milvus.validation."""
+    model = apps.get_model(label)
+    conn = get_connection(model, dbname)
+    queryset = filter_pk_slice(QuerySet(model=model, query=query), pk_slice)
+    with collect_rejected_rows() as rejected:
+        inserted = conn.bulk_insert_entries(
+            queryset, batch_size=batch_size, collection_name=collection_name
+        )
+    return inserted, rejected.get(model, {})
+
+
+def get_connection(model: Type[Model], dbname: str) -> Connection:
+    for field in model._meta.get_fields():
+        if isinstance(field, MilvusField) and field.dbname == dbname:
+            return field.get_connection()
+    raise ValueError(f"{model.__name__} has no MilvusField in {dbname}")
+
+
+def parallel_bulk_insert_entries(
+    conn: Connection,
+    queryset: QuerySet,
+    workers: int,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    collection_name: Optional[str] = None,
+) -> int:
+    """Parallel version of Connection.bulk_insert_entries(). The pk range is
+    split into slices that a pool of worker processes reads, encodes and
+    inserts concurrently, each with its own database cursor and milvus
+    connection. Returns the number of inserted rows.
+
+    Within a transaction, the rows are inserted by this process instead:
+    the workers wouldn't see its uncommitted rows, and closing the database
+    connection, which forking requires, would break it."""
+    model = queryset.model
+    if db_connections[queryset.db].in_atomic_block:
+        logger.warning(
+            "Inserting %s without workers, in a transaction", model._meta.label
+        )
+        return conn.bulk_insert_entries(
+            queryset, batch_size=batch_size, collection_name=collection_name
+        )
+    collection_name = collection_name or conn.get_collection_name(model)
+    start = time.monotonic()
+    count = queryset.count()
+    slice_size = max(batch_size, math.ceil(count / (workers * SLICES_PER_WORKER)))
+    slices = get_pk_slices(queryset, slice_size)
+    # The workers must open their own connections, not share the parent's.
+    # gRPC channels must not be open across a fork either: the milvus
+    # connections are closed until the workers are started.
+    db_connections.close_all()
+    milvus_connections = [conn] + [c for c in connections.all() if c is not conn]
+    for milvus_connection in milvus_connections:
+        milvus_connection.disconnect()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        try:
+            futures = [
+                pool.submit(
+                    insert_pk_slice,
+                    model._meta.label,
+                    queryset.query,
+                    conn.dbname,
+                    collection_name,
+                    pk_slice,
+                    batch_size,
+                )
+                for pk_slice in slices
+            ]
+        finally:
+            # Forked workers are all started by the first submit.
+            for milvus_connection in milvus_connections:
+                milvus_connection.connect()
+        inserted = 0
+        for future in futures:
+            count, rejected = future.result()
+            inserted += count
+            if rejected:
+                record_rejected_rows(model, rejected)
+    conn.invalidate_search_cache(model)
+    logger.info(
+        "Inserted %d rows of %s into %s in %.1fs with %d workers",
+        inserted,
+        model._meta.label,
+        collection_name,
+        time.monotonic() - start,
+        workers,
+    )
+    return inserted
@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+# Sent to milvus as search params, which one applies depends on the index.
+SEARCH_PARAM_NAMES = ("nprobe", "ef", "search_k")
+# Handled by django_milvus: milvus is asked for ceil(limit * overfetch) hits,
+# of which the limit nearest that pass the SQL filters are kept, and adaptive
+# searches ask for more until enough rows do, up to max_limit. See
+# Connection.search_nearest().
+QUERY_PARAM_NAMES = ("overfetch", "adaptive", "max_limit")
+
+_search_params: ContextVar[Dict[str, Any]] = ContextVar(
+    "django_milvus_search_params", default={}
+)
+_search_rounds: ContextVar[Optional[List[int]]] = ContextVar(
+    "django_milvus_search_rounds", default=None
+)
+
+
+@contextmanager
+def search_params(**params: Any) -> Iterator[None]:
+    """Overrides the search params of the MilvusFields for every search in
+    the block, without redeclaring the field:
+
+        with search_params(nprobe=8):
+            Product.objects.filter(similarity__nearest_10=vector)
+
+        with search_params(nprobe=256, overfetch=2):
+            Product.objects.nearest("similarity", vector, 100)
+
+        with search_params(adaptive=True):
+            Product.objects.filter(price__lt=10, similarity__nearest_10=vector)
+
+    Blocks can be nested, the innermost value of a param wins. See also
+    MilvusQuerySet.search_params()."""
+    unknown = set(params) - set(SEARCH_PARAM_NAMES) - set(QUERY_PARAM_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown search params: {sorted(unknown)}")
+    if "overfetch" in params and params["overfetch"] < 1:
+        raise ValueError("overfetch must be at least 1")
+    if "max_limit" in params and params["max_limit"] < 1:
+        raise ValueError("max_limit must be at least 1")
+    token = _search_params.set({**_search_params.get(), **params})
+    try:
+        yield
+    finally:
+        _search_params.reset(token)
+
+
+def get_search_params() -> Dict[str, Any]:
+    """Returns the overrides in effect."""
+    return _search_params.get()
+
+
+@contextmanager
+def record_search_rounds() -> Iterator[List[int]]:
+    """Collects the number of rounds of each search_nearest() in the block."""
+    rounds: List[int] = []
+    token = _search_rounds.set(rounds)
+    try:
+        yield rounds
+    finally:
+        _search_rounds.reset(token)
+
+
+def add_search_rounds(rounds: int) -> None:
+    collected = _search_rounds.get()
+    if collected is not None:
+        collected.append(rounds)
@@ -0,0 +1,167 @@
+import json
+from operator import attrgetter
+from typing import Any, Dict, List, Sequence, Type
+from uuid import UUID
+
+import numpy as np
+from django.db.models import Field
+from pymilvus import DataType, FieldSchema
+
+INT64_MIN = -(1 << 63)
+
+# pymilvus 2.0, for milvus 2.0, has no VARCHAR fields.
+SUPPORTS_VARCHAR = hasattr(DataType, "VARCHAR")
+
+
+class PkStrategy:
+    """How the django pks of a model are stored in its collection: the id
+    column, which is the milvus primary key, and the extra columns needed to
+    get the pk back from a search hit. Every method is vectorized."""
+
+    name = ""
+    # The extra columns, searches return them as output fields.
+    field_names: List[str] = []
+    # An id no other id is lower than.
+    min_id: Any = INT64_MIN
+
+    def __init__(self, pk_field: Field) -> None:
+        self.pk_field = pk_field
+
+    def get_field_schemas(self) -> List[FieldSchema]:
+        return [FieldSchema(name="id", dtype=DataType.INT64, is_primary=True)] + [
+            FieldSchema(name=name, dtype=DataType.INT64) for name in self.field_names
+        ]
+
+    def encode(self, pks: Sequence[Any]) -> List[np.ndarray]:
+        """Returns the id column followed by the extra columns."""
+        raise NotImplementedError()
+
+    def decode(self, ids: Sequence[Any], extra: Sequence[Sequence[Any]]) -> List[Any]:
+        """The inverse of encode()."""
+        raise NotImplementedError()
+
+    def format_ids(self, ids: np.ndarray) -> str:
+        """Returns ids as a list literal of a milvus expression."""
+        return str(ids.tolist())
+
+    def format_id(self, value: Any) -> str:
+        return str(value)
+
+
+class IntPkStrategy(PkStrategy):
+    """Integer pks are the ids, no extra column is needed."""
+
+    name = "int"
+
+    def encode(self, pks: Sequence[Any]) -> List[np.ndarray]:
+        return [np.asarray(pks, dtype=np.int64).reshape(-1)]
+
+    def decode(self, ids: Sequence[Any], extra: Sequence[Sequence[Any]]) -> List[Any]:
+        return np.asarray(ids, dtype=np.int64).tolist()
+
+
+def mix(values: np.ndarray) -> np.ndarray:
+    """A bijection of uint64 that spreads every input bit over the output,
+    the finalizer of splitmix64."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+class UUIDPkStrategy(PkStrategy):
+    """For milvus servers without VARCHAR primary keys (2.0), UUIDs stored as
+    int64 ids. UUIDs are split into their upper and lower 64 bits. The upper
+    half is stored in django_pk_high, and the id is the lower half xor a hash
+    of the upper half: the pk of a hit is recovered exactly, and ids depend
+    on all 128 bits, so uuid1 values of the same host don't share them.
+
+    128 bits don't fit in 64 though: distinct UUIDs can share an id. For
+    random UUIDs, the odds that any two of n rows do are about n² / 2⁶⁵,
+    1 in 37 for a billion rows. Rows that share an id are deleted together,
+    since milvus deletes by id, and sync_collection() reinserts them on every
+    run. Use the varchar strategy wherever the server supports it."""
+
+    name = "uuid"
+    field_names = ["django_pk_high"]
+
+    def encode(self, pks: Sequence[Any]) -> List[np.ndarray]:
+        if len(pks) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return [empty, empty]
+        uuids = [pk if isinstance(pk, UUID) else UUID(str(pk)) for pk in pks]
+        # Each uuid is 16 big endian bytes: the upper and the lower 64 bits.
+        halves = np.frombuffer(
+            b"".join(map(attrgetter("bytes"), uuids)), dtype=">u8"
+        ).reshape(-1, 2)
+        upper = halves[:, 0].astype(np.uint64)
+        lower = halves[:, 1].astype(np.uint64)
+        ids = lower ^ mix(upper)
+        return [ids.view(np.int64), upper.view(np.int64)]
+
+    def decode(self, ids: Sequence[Any], extra: Sequence[Sequence[Any]]) -> List[Any]:
+        upper = np.asarray(extra[0], dtype=np.int64).view(np.uint64)
+        lower = np.asarray(ids, dtype=np.int64).view(np.uint64) ^ mix(upper)
+        raw = np.stack([upper, lower], axis=1).astype(">u8").tobytes()
+        return [UUID(bytes=raw[i : i + 16]) for i in range(0, len(raw), 16)]
+
+
+class VarCharPkStrategy(PkStrategy):
+    """The ids are the pks as strings, which needs a milvus server with
+    VARCHAR primary keys (2.1 or later). Works with any pk field."""
+
+    name = "varchar"
+    min_id = ""
+
+    def get_field_schemas(self) -> List[FieldSchema]:
+        if not SUPPORTS_VARCHAR:
+            raise ValueError("The varchar pk strategy needs pymilvus 2.1 or later")
+        max_length = getattr(self.pk_field, "max_length", None) or 64
+        return [
+            FieldSchema(
+                name="id",
+                dtype=DataType.VARCHAR,
+                is_primary=True,
+                max_length=max_length,
+            )
+        ]
+
+    def encode(self, pks: Sequence[Any]) -> List[np.ndarray]:
+        return [np.array([str(pk) for pk in pks], dtype=object)]
+
+    def decode(self, ids: Sequence[Any], extra: Sequence[Sequence[Any]]) -> List[Any]:
+        return [self.pk_field.to_python(value) for value in ids]
+
+    def format_ids(self, ids: np.ndarray) -> str:
+        return json.dumps([str(value) for value in ids])
+
+    def format_id(self, value: Any) -> str:
+        return json.dumps(str(value))
+
+
+PK_STRATEGIES: Dict[str, Type[PkStrategy]] = {
+    strategy.name: strategy
+    for strategy in [IntPkStrategy, UUIDPkStrategy, VarCharPkStrategy]
+}
+
+INTEGER_FIELD_TYPES = (
+    "AutoField",
+    "BigAutoField",
+    "SmallAutoField",
+    "IntegerField",
+    "BigIntegerField",
+    "SmallIntegerField",
+    "PositiveIntegerField",
+    "PositiveBigIntegerField",
+    "PositiveSmallIntegerField",
+)
+
+
+def get_default_pk_strategy(pk_field: Field) -> str:
+    target = pk_field.target_field if pk_field.is_relation else pk_field
+    internal_type = target.get_internal_type()
+    if internal_type in INTEGER_FIELD_TYPES:
+        return IntPkStrategy.name
+    if SUPPORTS_VARCHAR:
+        # UUIDs too, the uuid strategy has to be chosen explicitly.
+        return VarCharPkStrategy.name
+    return UUIDPkStrategy.name
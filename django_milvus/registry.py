@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Type
+
+from django.conf import settings
+
+from django_milvus.connection import Connection
+from django_milvus.futures import run_blocking
+
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+
+
+class ConnectionRegistry:
+    """Lazily creates one connected Connection per milvus alias and per
+    process, similar to django.db.connections.
+
+    gRPC channels must not be shared with a forked child, so the registry is
+    emptied in the child after a fork (and whenever the pid is found to have
+    changed) and the child connects again on first use. Connections that have
+    been idle for longer than MILVUS["HEALTH_CHECK_INTERVAL"] seconds are
+    checked with a cheap RPC before being handed out, and replaced if broken.
+    """
+
+    STAT_KEYS = (
+        "connects",
+        "reconnects",
+        "reuses",
+        "health_checks",
+        "health_check_failures",
+    )
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self._connections: Dict[str, Connection] = {}
+        # Survives forks, so that a child reconnects with the same class.
+        self._classes: Dict[str, Type[Connection]] = {}
+        self._last_used: Dict[str, float] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def __getitem__(self, dbname: str) -> Connection:
+        return self.get(dbname)
+
+    def get(
+        self, dbname: str, connection_class: Optional[Type[Connection]] = None
+    ) -> Connection:
+        self.check_fork()
+        with self._lock:
+            stats = self._stats.setdefault(dbname, dict.fromkeys(self.STAT_KEYS, 0))
+            conn = self._connections.get(dbname)
+            if conn is None:
+                conn = self.connect(
+                    dbname,
+                    connection_class or self._classes.get(dbname, Connection),
+                )
+                stats["connects"] += 1
+            elif self.is_health_check_due(dbname):
+                stats["health_checks"] += 1
+                if conn.is_healthy():
+                    stats["reuses"] += 1
+                else:
+                    stats["health_check_failures"] += 1
+                    conn.disconnect()
+                    conn = self.connect(dbname, type(conn))
+                    stats["reconnects"] += 1
+            else:
+                stats["reuses"] += 1
+            self._last_used[dbname] = time.monotonic()
+            return conn
+
+    async def aget(
+        self, dbname: str, connection_class: Optional[Type[Connection]] = None
+    ) -> Connection:
+        """Async version of get(). Only goes through a thread when it has to
+        connect or health check, which get() does with blocking calls."""
+        self.check_fork()
+        with self._lock:
+            conn = self._connections.get(dbname)
+            if conn is not None and not self.is_health_check_due(dbname):
+                self._stats[dbname]["reuses"] += 1
+                self._last_used[dbname] = time.monotonic()
+                return conn
+        return await run_blocking(self.get, dbname, connection_class)
+
+    def connect(self, dbname: str, connection_class: Type[Connection]) -> Connection:
+        conn = connection_class(dbname)
+        conn.connect()
+        self._connections[dbname] = conn
+        self._classes[dbname] = connection_class
+        return conn
+
+    def is_health_check_due(self, dbname: str) -> bool:
+        interval = settings.MILVUS.get(
+            "HEALTH_CHECK_INTERVAL", DEFAULT_HEALTH_CHECK_INTERVAL
+        )
+        last_used = self._last_used.get(dbname, 0.0)
+        return time.monotonic() - last_used > interval
+
+    def check_fork(self) -> None:
+        if self._pid != os.getpid():
+            self.reset_after_fork()
+
+    def reset_after_fork(self) -> None:
+        """Forgets the connections inherited from the parent process. They are
+        not closed: the channels belong to the parent."""
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        for conn in self._connections.values():
+            conn.forget()
+        self._connections = {}
+        self._last_used = {}
+        self._stats = {}
+
+    def all(self) -> List[Connection]:
+        """The open connections of this process."""
+        self.check_fork()
+        with self._lock:
+            return list(self._connections.values())
+
+    def close_all(self) -> None:
+        with self._lock:
+            for conn in self._connections.values():
+                conn.disconnect()
+            self._connections = {}
+            self._last_used = {}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns per alias counters of this process, plus whether the alias
+        currently has an open connection."""
+        self.check_fork()
+        with self._lock:
+            return {
+                dbname: {
+                    **counters,
+                    "connected": int(dbname in self._connections),
+                    "pid": self._pid,
+                }
+                for dbname, counters in self._stats.items()
+            }
+
+
+connections = ConnectionRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=connections.reset_after_fork)
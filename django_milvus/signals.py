@@ -0,0 +1,97 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Type
+
+from django.db import transaction
+from django.db.models import Model
+
+from django_milvus.validation import MAX_LOGGED_PKS
+
+logger = logging.getLogger("django_milvus")
+
+_collected_deletes: ContextVar[Optional[Dict[Type[Model], List[Any]]]] = ContextVar(
+    "django_milvus_collected_deletes", default=None
+)
+
+
+@contextmanager
+def collect_deletes() -> Iterator[Dict[Type[Model], List[Any]]]:
+    """Within the block, delete_entry_on_model_delete() only records the pks
+    of the deleted rows, so that the caller can delete them in batches."""
+    collected: Dict[Type[Model], List[Any]] = {}
+    token = _collected_deletes.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected_deletes.reset(token)
+
+
+def delete_entry_on_model_delete(
+    sender: Type[Model], instance: Model, **kwargs: Any
+) -> None:
+    """post_delete receiver connected by MilvusField, so that deleted django
+    rows don't leave their vectors behind. Runs once the transaction commits,
+    a rolled back delete keeps its vectors. With MILVUS["AUTO_SYNC"], the
+    delete is queued and batched with others instead."""
+    from django_milvus.sync import get_sync_buffer, is_synced
+
+    # django clears instance.pk once the row is gone, keep our own copy.
+    pk = instance.pk
+    collected = _collected_deletes.get()
+    if collected is not None:
+        collected.setdefault(sender, []).append(pk)
+    elif is_synced(sender):
+        buffer = get_sync_buffer()
+        transaction.on_commit(
+            lambda: buffer.add(sender, pk, None), using=kwargs.get("using")
+        )
+    else:
+        delete_entries_on_commit(sender, [pk], using=kwargs.get("using"))
+
+
+def delete_entries_on_commit(
+    model: Type[Model], pks: List[Any], using: Optional[str] = None
+) -> None:
+    """Deletes the vectors of pks once the transaction commits. The rows are
+    gone from the database by then, so a failed delete is logged instead of
+    raised to the caller of the commit. rebuild_index() drops the vectors it
+    leaves behind."""
+    from django_milvus.utils import delete_entries
+
+    def delete() -> None:
+        try:
+            delete_entries(model, pks)
+        except Exception:
+            logger.exception(
+                "Failed to delete %d rows of %s from milvus: %s",
+                len(pks),
+                model._meta.label,
+                pks[:MAX_LOGGED_PKS],
+            )
+
+    transaction.on_commit(delete, using=using)
+
+
+def sync_entry_on_model_save(
+    sender: Type[Model], instance: Model, **kwargs: Any
+) -> None:
+    """post_save receiver connected by MilvusField. With MILVUS["AUTO_SYNC"],
+    queues the saved vectors once the transaction commits."""
+    from django_milvus.fields import MilvusField
+    from django_milvus.options import get_milvus_options
+    from django_milvus.sync import get_sync_buffer, is_synced
+
+    if kwargs.get("raw") or not is_synced(sender):
+        return
+    # The values as saved, later changes to the instance don't matter.
+    attnames = [
+        f.attname for f in sender._meta.get_fields() if isinstance(f, MilvusField)
+    ]
+    attnames += get_milvus_options(sender).get_scalar_attnames()
+    values = {attname: getattr(instance, attname) for attname in attnames}
+    pk = instance.pk
+    buffer = get_sync_buffer()
+    transaction.on_commit(
+        lambda: buffer.add(sender, pk, values), using=kwargs.get("using")
+    )
@@ -0,0 +1,229 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Type
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import Model
+
+from django_milvus.validation import MAX_LOGGED_PKS
+
+logger = logging.getLogger("django_milvus")
+
+DEFAULT_FLUSH_INTERVAL_MS = 200
+DEFAULT_FLUSH_ROWS = 1000
+DEFAULT_MAX_RETRIES = 5
+# The delay before retrying a model that failed to sync doubles with each
+# failure, up to this many seconds.
+MAX_RETRY_DELAY = 60
+
+# {model: {pk: {attname: vector} to upsert, or None to delete}}
+Pending = Dict[Type[Model], Dict[Any, Optional[Dict[str, Any]]]]
+
+
+def get_sync_options() -> Optional[Dict[str, Any]]:
+    """Automatic syncing is opt-in, with MILVUS["AUTO_SYNC"]:
+
+        "AUTO_SYNC": {
+            "MODELS": ["shop.Product"],  # optional, defaults to every model
+            "FLUSH_INTERVAL_MS": 200,
+            "FLUSH_ROWS": 1000,
+            "MAX_RETRIES": 5,
+        }
+
+    Saved and deleted rows are queued once their transaction commits, and a
+    background thread sends one delete and one insert per collection every
+    FLUSH_INTERVAL_MS, or as soon as FLUSH_ROWS rows are queued. Rows that
+    fail to sync are retried after a delay that doubles with each failure,
+    and dropped after MAX_RETRIES retries, to be fixed by rebuild_index()."""
+    return settings.MILVUS.get("AUTO_SYNC")
+
+
+def is_synced(model: Type[Model]) -> bool:
+    options = get_sync_options()
+    if options is None:
+        return False
+    models = options.get("MODELS")
+    return models is None or model._meta.label in models
+
+
+class SyncBuffer:
+    def __init__(
+        self,
+        interval: float,
+        max_rows: int,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ) -> None:
+        self.interval = interval
+        self.max_rows = max_rows
+        self.max_retries = max_retries
+        self.condition = threading.Condition()
+        # Held while a batch is sent, so that flushes run one at a time: a
+        # flush() returns once everything queued before it is sent, and the
+        # changes of a row are sent in order.
+        self.flush_lock = threading.Lock()
+        self.pending: Pending = {}
+        self.count = 0
+        # The consecutive failures of the models that failed to sync, and
+        # when the background thread retries them.
+        self.failures: Dict[Type[Model], int] = {}
+        self.retry_at: Dict[Type[Model], float] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.pid = os.getpid()
+
+    def add(
+        self, model: Type[Model], pk: Any, values: Optional[Dict[str, Any]]
+    ) -> None:
+        """Queues an upsert of values, or a delete if values is None. Later
+        changes of the same row replace the queued one."""
+        with self.condition:
+            self.start()
+            rows = self.pending.setdefault(model, {})
+            if pk not in rows:
+                self.count += 1
+            rows[pk] = values
+            if self.count >= self.max_rows:
+                self.condition.notify()
+
+    def start(self) -> None:
+        if self.pid != os.getpid():
+            # Forked: the flusher thread and the queued rows are the parent's.
+            self.pid = os.getpid()
+            self.pending = {}
+            self.count = 0
+            self.failures = {}
+            self.retry_at = {}
+            self.thread = None
+            self.flush_lock = threading.Lock()
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(
+                target=self.run, name="django_milvus_sync", daemon=True
+            )
+            self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                # The rows of models that are waiting to be retried don't
+                # trigger flushes.
+                if self.count < self.max_rows or self.retry_at:
+                    self.condition.wait(self.interval)
+            self.flush(retry_now=False)
+
+    def flush(self, retry_now: bool = True) -> None:
+        """Sends everything queued so far, or, unless retry_now, the rows of
+        the models that failed to sync only once their retry delay is over.
+        The rows of a model that fails to sync are queued again, up to
+        max_retries times in a row."""
+        with self.flush_lock:
+            now = time.monotonic()
+            with self.condition:
+                pending = {
+                    model: rows
+                    for model, rows in self.pending.items()
+                    if retry_now or self.retry_at.get(model, now) <= now
+                }
+                for model, rows in pending.items():
+                    del self.pending[model]
+                    self.count -= len(rows)
+            for model, rows in pending.items():
+                try:
+                    self.flush_model(model, rows)
+                except Exception:
+                    self.retry(model, rows)
+                else:
+                    self.failures.pop(model, None)
+                    self.retry_at.pop(model, None)
+
+    def retry(
+        self, model: Type[Model], rows: Dict[Any, Optional[Dict[str, Any]]]
+    ) -> None:
+        """Queues the rows of a failed flush again, or drops them if the
+        model failed too many times in a row. Logs the current exception."""
+        failures = self.failures.get(model, 0) + 1
+        if failures > self.max_retries:
+            logger.exception(
+                "Failed to sync %s rows of %s to milvus %s times, dropping them: %s",
+                len(rows),
+                model._meta.label,
+                failures,
+                list(rows)[:MAX_LOGGED_PKS],
+            )
+            self.failures.pop(model, None)
+            self.retry_at.pop(model, None)
+            return
+        delay = min(self.interval * 2**failures, MAX_RETRY_DELAY)
+        logger.exception(
+            "Failed to sync %s rows of %s to milvus, will retry in %.1fs",
+            len(rows),
+            model._meta.label,
+            delay,
+        )
+        self.failures[model] = failures
+        self.retry_at[model] = time.monotonic() + delay
+        self.requeue(model, rows)
+
+    def requeue(
+        self, model: Type[Model], rows: Dict[Any, Optional[Dict[str, Any]]]
+    ) -> None:
+        """Queues rows again, unless they changed since."""
+        with self.condition:
+            queued = self.pending.setdefault(model, {})
+            for pk, values in rows.items():
+                if pk not in queued:
+                    queued[pk] = values
+                    self.count += 1
+
+    def flush_model(
+        self, model: Type[Model], rows: Dict[Any, Optional[Dict[str, Any]]]
+    ) -> None:
+        from django_milvus.utils import iter_existing_connections
+
+        upserts = {pk: values for pk, values in rows.items() if values is not None}
+        pks = list(upserts)
+        columns: Dict[str, List[Any]] = {}
+        for values in upserts.values():
+            for attname, value in values.items():
+                columns.setdefault(attname, []).append(value)
+        for conn in iter_existing_connections(model):
+            conn.delete_entries_by_pk(model, list(rows))
+            if pks:
+                conn.insert_values(model, pks, columns)
+
+
+_buffer: Optional[SyncBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_sync_buffer() -> SyncBuffer:
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            options = get_sync_options() or {}
+            _buffer = SyncBuffer(
+                interval=options.get("FLUSH_INTERVAL_MS", DEFAULT_FLUSH_INTERVAL_MS)
+                / 1000,
+                max_rows=options.get("FLUSH_ROWS", DEFAULT_FLUSH_ROWS),
+                max_retries=options.get("MAX_RETRIES", DEFAULT_MAX_RETRIES),
+            )
+        return _buffer
+
+
+def flush() -> None:
+    """Sends the queued changes now, instead of waiting for the flusher."""
+    if _buffer is not None:
+        _buffer.flush()
+
+
+def reset_sync_buffer(**kwargs: Any) -> None:
+    global _buffer
+    if kwargs.get("setting", "MILVUS") == "MILVUS":
+        flush()
+        _buffer = None
+
+
+setting_changed.connect(reset_sync_buffer)
+atexit.register(flush)
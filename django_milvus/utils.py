@@ -1,33 +1,152 @@
-from typing import Type
+from typing import Any, Dict, Iterator, List, Sequence, Set, Type
 
 from django.db.models.base import Model
 from django.db.models.query import QuerySet
 
-from django_milvus.connection import Connection
+from django_milvus.connection import DEFAULT_BATCH_SIZE, Connection
 from django_milvus.fields import MilvusField
+from django_milvus.registry import connections
+from django_milvus.validation import collect_rejected_rows
 
 
-def rebuild_index(model: Type[Model]) -> None:
-    """Removes milvus collection and recreate."""
+def rebuild_index(
+    model: Type[Model],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    incremental: bool = False,
+    shadow: bool = False,
+    workers: int = 1,
+) -> Dict[str, Dict[str, int]]:
+    """Removes milvus collection and recreate. Rows are streamed from the
+    database and inserted batch_size at a time.
+
+    With incremental=True, an existing collection is kept and only the rows
+    that changed since it was built are written, see
+    Connection.sync_collection(). Collections with an outdated schema are
+    still recreated.
+
+    With shadow=True, searches keep working during the rebuild: a new version
+    of the collection is built next to the current one and replaces it once
+    it is loaded, see Connection.rebuild_collection().
+
+    With workers > 1, the rows are read, encoded and inserted by that many
+    processes, see django_milvus.parallel. Incremental rebuilds don't use
+    them.
+
+    Rows whose vectors milvus can't store are left out, and counted as
+    rejected, see django_milvus.validation to get their pks.
+
+    Returns the row counts of each milvus database."""
     fields = [f for f in model._meta.get_fields() if isinstance(f, MilvusField)]
     dbnames = set([f.dbname for f in fields])
-    connections = set()
+    used = set()
+    counts = {}
     for db in dbnames:
-        conn = Connection(db)
-        conn.connect()
-        connections.add(conn)
-        if conn.has_collection(model):
-            conn.remove_collection(model)
-        conn.create_collection(model)
-        conn.bulk_update_entries(QuerySet(model=model).all())
-    for conn in connections:
+        conn = connections[db]
+        used.add(conn)
+        with collect_rejected_rows() as rejected:
+            counts[db] = rebuild_connection_index(
+                conn, model, batch_size, incremental, shadow, workers
+            )
+        counts[db]["rejected"] = len(rejected.get(model, {}))
+    for conn in used:
         conn.flush(model)
+    return counts
+
+
+def rebuild_connection_index(
+    conn: Connection,
+    model: Type[Model],
+    batch_size: int,
+    incremental: bool,
+    shadow: bool,
+    workers: int,
+) -> Dict[str, int]:
+    queryset = QuerySet(model=model).all()
+    if conn.has_collection(model):
+        if incremental and conn.has_current_schema(model):
+            return conn.sync_collection(queryset, batch_size=batch_size)
+        if shadow:
+            inserted = conn.rebuild_collection(
+                queryset, batch_size=batch_size, workers=workers
+            )
+            return {"inserted": inserted}
+        conn.remove_collection(model)
+    conn.create_collection(model)
+    # The collection is brand new, so there is nothing to delete first.
+    inserted = conn.bulk_insert_entries(
+        queryset, batch_size=batch_size, workers=workers
+    )
+    return {"inserted": inserted}
 
 
 def update_entry(instance: Model) -> None:
     fields = [f for f in instance._meta.get_fields() if isinstance(f, MilvusField)]
     dbnames = set([f.dbname for f in fields])
     for db in dbnames:
-        conn = Connection(db)
-        conn.connect()
+        conn = connections[db]
         conn.update_entry(instance)
+
+
+async def aupdate_entry(instance: Model) -> None:
+    fields = [f for f in instance._meta.get_fields() if isinstance(f, MilvusField)]
+    dbnames = set([f.dbname for f in fields])
+    for db in dbnames:
+        conn = await connections.aget(db)
+        await conn.aupdate_entry(instance)
+
+
+def delete_entry(instance: Model) -> None:
+    delete_entries(instance._meta.model, [instance.pk])
+
+
+def delete_entries(model: Type[Model], pks: Sequence[Any]) -> None:
+    """Removes the vectors of the given django pks from every milvus database
+    the model has fields in."""
+    for conn in iter_existing_connections(model):
+        conn.delete_entries_by_pk(model, pks)
+
+
+def get_dbnames(model: Type[Model]) -> Set[str]:
+    fields = [f for f in model._meta.get_fields() if isinstance(f, MilvusField)]
+    return set([f.dbname for f in fields])
+
+
+def iter_existing_connections(model: Type[Model]) -> Iterator[Connection]:
+    """Yields the connections of the model's databases that have its
+    collection. Writes that mirror ORM operations skip the others, the
+    collection is created by rebuild_index()."""
+    for db in get_dbnames(model):
+        conn = connections[db]
+        if conn.has_collection(model):
+            yield conn
+
+
+def bulk_insert_instances(model: Type[Model], instances: Sequence[Model]) -> None:
+    instances = [obj for obj in instances if obj.pk is not None]
+    if not instances:
+        return
+    for conn in iter_existing_connections(model):
+        conn.bulk_insert_instances(model, instances)
+
+
+def bulk_update_instances(model: Type[Model], instances: Sequence[Model]) -> None:
+    if not instances:
+        return
+    for conn in iter_existing_connections(model):
+        conn.delete_entries_by_pk(model, [obj.pk for obj in instances])
+        conn.bulk_insert_instances(model, instances)
+
+
+def update_entries(
+    model: Type[Model], pks: List[Any], batch_size: int = DEFAULT_BATCH_SIZE
+) -> None:
+    """Replaces the vectors of the given pks with what is in the database."""
+    if not pks:
+        return
+    for conn in iter_existing_connections(model):
+        for start in range(0, len(pks), batch_size):
+            chunk = pks[start : start + batch_size]
+            conn.delete_entries_by_pk(model, chunk)
+            conn.bulk_insert_entries(
+                QuerySet(model=model).filter(pk__in=chunk), batch_size=batch_size
+            )
@@ -0,0 +1,97 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Tuple, Type
+
+from django.db.models import Model
+
+logger = logging.getLogger("django_milvus")
+
+# The pks of the rows that milvus can't store, and why, by model.
+RejectedRows = Dict[Type[Model], Dict[Any, str]]
+
+_rejected_rows: ContextVar[Tuple[RejectedRows, ...]] = ContextVar(
+    "django_milvus_rejected_rows", default=()
+)
+
+# Rejections are logged with at most this many pks.
+MAX_LOGGED_PKS = 20
+
+# The error codes milvus refuses the rows of an insert with: IllegalArgument,
+# IllegalDimension, IllegalRowRecord and IllegalVectorID.
+DATA_ERROR_CODES = {5, 7, 11, 12}
+
+# The pymilvus exceptions raised for rows that don't match the schema. They
+# are matched by name, pymilvus 2.0 and 2.2 define them in different modules.
+DATA_EXCEPTION_NAMES = {
+    "ParamError",
+    "DataNotMatchException",
+    "DataTypeNotMatchException",
+}
+# pymilvus 2.0 derives its connection errors from ValueError.
+CONNECTION_EXCEPTION_NAMES = {"ConnectError", "MilvusUnavailableException"}
+# The error codes that a fresh collection handle may get past: ConnectFailed,
+# and CollectionNotExists once another process rebuilt the collection.
+RETRY_ERROR_CODES = {2, 4}
+
+
+@contextmanager
+def collect_rejected_rows() -> Iterator[RejectedRows]:
+    """Within the block, the rows left out of bulk inserts because their
+    vectors are invalid or milvus refused them are recorded in the yielded
+    dict, as {model: {pk: reason}}. Blocks can be nested, each one sees the
+    rows rejected within it."""
+    collected: RejectedRows = {}
+    token = _rejected_rows.set(_rejected_rows.get() + (collected,))
+    try:
+        yield collected
+    finally:
+        _rejected_rows.reset(token)
+
+
+def reject_rows(model: Type[Model], reasons: Dict[Any, str]) -> None:
+    """Logs and records rows that were not inserted, reasons being a
+    {pk: reason} dict."""
+    logger.warning(
+        "Left %d rows of %s out of milvus: %s",
+        len(reasons),
+        model._meta.label,
+        dict(list(reasons.items())[:MAX_LOGGED_PKS]),
+    )
+    record_rejected_rows(model, reasons)
+
+
+def record_rejected_rows(model: Type[Model], reasons: Dict[Any, str]) -> None:
+    for collected in _rejected_rows.get():
+        collected.setdefault(model, {}).update(reasons)
+
+
+def is_data_error(error: Exception) -> bool:
+    """Whether an insert failed because of the rows themselves, refused by
+    pymilvus or by milvus, rather than because of the connection or a
+    timeout, which retrying parts of the rows can't help with."""
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & CONNECTION_EXCEPTION_NAMES:
+        return False
+    if names & DATA_EXCEPTION_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in DATA_ERROR_CODES
+    return isinstance(error, (ValueError, TypeError))
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether a search may succeed if tried again with a fresh collection
+    handle: the connection failed, milvus is unavailable, or the collection
+    was dropped by a rebuild. Never for data errors."""
+    if is_data_error(error):
+        return False
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if isinstance(error, ConnectionError) or names & CONNECTION_EXCEPTION_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    if callable(code):
+        # A grpc.RpcError, whose code() is a grpc.StatusCode.
+        return getattr(code(), "name", None) == "UNAVAILABLE"
+    return code in RETRY_ERROR_CODES
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:51
+
+import uuid
+
+import pymilvus.client.types
+from django.db import migrations, models
+
+import django_milvus.fields
+import django_milvus_tests.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_milvus_tests", "0003_productuuid"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategorizedProduct",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("category", models.CharField(max_length=50)),
+                (
+                    "similarity",
+                    django_milvus.fields.MilvusField(
+                        dbname="default",
+                        default=django_milvus_tests.models.random_vector_2,
+                        dim=2,
+                        dtype=pymilvus.client.types.DataType["FLOAT_VECTOR"],
+                        index_type="IVF_FLAT",
+                        metric_type="L2",
+                        nlist=1024,
+                        nprobe=32,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="productuuid",
+            name="id",
+            field=models.UUIDField(
+                default=uuid.uuid4, primary_key=True, serialize=False
+            ),
+        ),
+    ]
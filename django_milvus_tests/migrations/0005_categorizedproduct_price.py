@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_milvus_tests", "0004_categorizedproduct"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="categorizedproduct",
+            name="price",
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:59
+
+import pymilvus.client.types
+from django.db import migrations, models
+
+import django_milvus.fields
+import django_milvus_tests.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_milvus_tests", "0005_categorizedproduct_price"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PackedProduct",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "similarity",
+                    django_milvus.fields.MilvusField(
+                        dbname="default",
+                        default=django_milvus_tests.models.random_vector_2,
+                        dim=2,
+                        dtype=pymilvus.client.types.DataType["FLOAT_VECTOR"],
+                        index_type="IVF_FLAT",
+                        metric_type="L2",
+                        nlist=1024,
+                        nprobe=32,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:01
+
+import pymilvus.client.types
+from django.db import migrations, models
+
+import django_milvus.fields
+import django_milvus_tests.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_milvus_tests", "0007_packedproduct_storage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HashedProduct",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "similarity",
+                    django_milvus.fields.MilvusField(
+                        dbname="default",
+                        default=django_milvus_tests.models.random_bits_16,
+                        dim=16,
+                        dtype=pymilvus.client.types.DataType["BINARY_VECTOR"],
+                        index_type="BIN_IVF_FLAT",
+                        metric_type="HAMMING",
+                        nlist=1024,
+                        nprobe=32,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_milvus_tests", "0008_hashedproduct"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="categorizedproduct",
+            name="stock",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -3,10 +3,11 @@ from typing import List
 from uuid import uuid4
 
 from django.db.models import Model
-from django.db.models.fields import UUIDField
+from django.db.models.fields import CharField, FloatField, IntegerField, UUIDField
 from pymilvus.client.types import DataType
 
 from django_milvus.fields import MilvusField
+from django_milvus.managers import MilvusManager
 
 
 def random_vector(dim: int) -> List[int]:
@@ -21,6 +22,10 @@ def random_vector_16():
     return random_vector(16)
 
 
+def random_bits_16():
+    return [random.randrange(2) for _ in range(16)]
+
+
 class Product(Model):
     similarity = MilvusField(
         dim=2, dtype=DataType.FLOAT_VECTOR, default=random_vector_2
@@ -29,9 +34,48 @@ class Product(Model):
         dim=16, dtype=DataType.FLOAT_VECTOR, default=random_vector_16
     )
 
+    objects = MilvusManager()
+
 
 class ProductUUID(Model):
     id = UUIDField(primary_key=True, default=uuid4)
     similarity = MilvusField(
         dim=2, dtype=DataType.FLOAT_VECTOR, default=random_vector_2
     )
+
+    objects = MilvusManager()
+
+
+class CategorizedProduct(Model):
+    category = CharField(max_length=50)
+    price = FloatField(default=0)
+    stock = IntegerField(default=0)
+    similarity = MilvusField(
+        dim=2, dtype=DataType.FLOAT_VECTOR, default=random_vector_2
+    )
+
+    objects = MilvusManager()
+
+    class MilvusMeta:
+        partition_by = "category"
+        mirror_fields = ["price", "stock"]
+
+
+class PackedProduct(Model):
+    similarity = MilvusField(
+        dim=2, dtype=DataType.FLOAT_VECTOR, default=random_vector_2, storage="float32"
+    )
+
+    objects = MilvusManager()
+
+
+class HashedProduct(Model):
+    similarity = MilvusField(
+        dim=16,
+        dtype=DataType.BINARY_VECTOR,
+        index_type="BIN_IVF_FLAT",
+        metric_type="HAMMING",
+        default=random_bits_16,
+    )
+
+    objects = MilvusManager()
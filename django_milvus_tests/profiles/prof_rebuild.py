@@ -0,0 +1,38 @@
+import os
+import random
+import time
+from typing import List
+
+from django.test import TransactionTestCase
+
+from django_milvus.utils import rebuild_index
+from django_milvus_tests.models import Product
+
+
+def random_vector(dim: int) -> List[int]:
+    return [random.randrange(-100, 100) for _ in range(dim)]
+
+
+class TestParallelRebuild(TransactionTestCase):
+    # The workers read the table with their own connections, so the rows must
+    # be committed: no TestCase here.
+
+    def test_rebuild_speedup(self):
+        print("create items")
+        Product.objects.bulk_create(
+            [Product(largefield=random_vector(dim=16)) for _ in range(10**6)],
+            batch_size=10000,
+        )
+        cores = os.cpu_count() or 1
+        workers = [1]
+        while workers[-1] * 2 <= cores:
+            workers.append(workers[-1] * 2)
+        print("workers\trows\tseconds\tspeedup")
+        baseline = None
+        for count in workers:
+            start = time.monotonic()
+            counts = rebuild_index(Product, workers=count)
+            seconds = time.monotonic() - start
+            baseline = baseline or seconds
+            rows = counts["default"]["inserted"]
+            print(f"{count}\t{rows}\t{seconds:.1f}\t{baseline / seconds:.2f}x")
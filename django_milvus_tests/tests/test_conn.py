@@ -1,10 +1,31 @@
 import random
+import tempfile
+import threading
+from concurrent.futures import Future
 from typing import List
+from unittest import mock
+from uuid import UUID, uuid1
 
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, override_settings
+from pymilvus.client.asynch import MutationFuture
+from pymilvus.grpc_gen import common_pb2, milvus_pb2
+from pymilvus.orm.future import MutationFuture as CollectionMutationFuture
 
+from django_milvus import sync
+from django_milvus.backends.memory import reset_databases
+from django_milvus.futures import await_milvus_future
+from django_milvus.options import get_milvus_options
+from django_milvus.parallel import (
+    filter_pk_slice,
+    get_pk_slices,
+    parallel_bulk_insert_entries,
+)
+from django_milvus.pk import SUPPORTS_VARCHAR, UUIDPkStrategy
+from django_milvus.registry import connections
 from django_milvus.utils import rebuild_index, update_entry
-from django_milvus_tests.models import Product
+from django_milvus.validation import collect_rejected_rows
+from django_milvus_tests.models import CategorizedProduct, Product, ProductUUID
 
 
 def random_vector(dim: int) -> List[int]:
@@ -24,3 +45,320 @@ class TestMilvusConnection(TestCase):
         for i in range(10):
             product = Product.objects.create(similarity=[12, 34])
             update_entry(product)
+
+    def test_rebuild_index_in_batches(self):
+        for i in range(5):
+            Product.objects.create(similarity=[i, i])
+        rebuild_index(Product, batch_size=2)
+        actual = Product.objects.filter(similarity__nearest_1=[4, 4]).first()
+        self.assertEqual([4, 4], actual.similarity)
+
+    def test_update_entry_keeps_one_vector_per_row(self):
+        p1 = Product.objects.create(similarity=[0, 0])
+        p2 = Product.objects.create(similarity=[50, 50])
+        rebuild_index(Product)
+        for i in range(3):
+            p1.similarity = [i, i]
+            p1.save()
+            update_entry(p1)
+        actual = Product.objects.filter(similarity__nearest_2=[0, 0])
+        self.assertEqual({p1, p2}, set(actual))
+
+    def test_connection_is_reused(self):
+        conn = connections["default"]
+        self.assertIs(conn, connections["default"])
+        stats = connections.stats()["default"]
+        self.assertEqual(1, stats["connected"])
+        self.assertGreaterEqual(stats["reuses"], 1)
+
+    def test_auto_sync(self):
+        Product.objects.create(similarity=[0, 0])
+        rebuild_index(Product)
+        auto_sync = {**settings.MILVUS, "AUTO_SYNC": {"FLUSH_INTERVAL_MS": 10}}
+        with override_settings(MILVUS=auto_sync):
+            with self.captureOnCommitCallbacks(execute=True):
+                product = Product.objects.create(similarity=[7, 7])
+            sync.flush()
+            actual = Product.objects.filter(similarity__nearest_1=[7, 7]).first()
+            self.assertEqual(product, actual)
+
+    def test_failed_sync_is_retried(self):
+        sent = []
+
+        class FlakySyncBuffer(sync.SyncBuffer):
+            def flush_model(self, model, rows):
+                if not sent:
+                    sent.append(None)
+                    raise ConnectionError()
+                sent.append(dict(rows))
+
+        buffer = FlakySyncBuffer(interval=60, max_rows=1000)
+        buffer.add(Product, 1, {"similarity": [1, 1]})
+        with self.assertLogs("django_milvus", "ERROR"):
+            buffer.flush()
+        buffer.add(Product, 2, None)
+        buffer.flush()
+        self.assertEqual([None, {1: {"similarity": [1, 1]}, 2: None}], sent)
+
+    def test_failed_sync_is_dropped_after_retries(self):
+        calls = []
+
+        class FailingSyncBuffer(sync.SyncBuffer):
+            def flush_model(self, model, rows):
+                calls.append(dict(rows))
+                raise ConnectionError()
+
+        buffer = FailingSyncBuffer(interval=60, max_rows=1000, max_retries=1)
+        buffer.add(Product, 1, None)
+        with self.assertLogs("django_milvus", "ERROR"):
+            buffer.flush()
+        # Waiting for its retry delay.
+        buffer.flush(retry_now=False)
+        self.assertEqual(1, len(calls))
+        with self.assertLogs("django_milvus", "ERROR") as logs:
+            buffer.flush()
+        self.assertIn("dropping them", logs.output[0])
+        self.assertEqual({}, buffer.pending)
+        self.assertEqual(2, len(calls))
+
+    def test_sync_skips_missing_collections(self):
+        conn = connections["default"]
+        if conn.has_collection(Product):
+            conn.remove_collection(Product)
+        buffer = sync.SyncBuffer(interval=60, max_rows=1000)
+        buffer.add(Product, 1, {"similarity": [1, 1]})
+        buffer.flush()
+        self.assertEqual({}, buffer.pending)
+        self.assertEqual({}, buffer.failures)
+
+    def test_bulk_operations_are_mirrored(self):
+        Product.objects.create(similarity=[0, 0])
+        rebuild_index(Product)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.bulk_create([Product(similarity=[5, 5])])
+        actual = Product.objects.filter(similarity__nearest_1=[5, 5]).first()
+        self.assertEqual(actual.similarity, [5, 5])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=actual.pk).update(similarity=[-9, -9])
+        self.assertEqual(
+            Product.objects.filter(similarity__nearest_1=[-9, -9]).first(), actual
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=actual.pk).delete()
+        self.assertNotEqual(
+            Product.objects.filter(similarity__nearest_1=[-9, -9]).first(), actual
+        )
+
+    def test_failed_delete_is_logged_after_commit(self):
+        product = Product.objects.create(similarity=[0, 0])
+        Product.objects.create(similarity=[1, 1])
+        failing = mock.Mock(side_effect=ConnectionError("milvus is down"))
+        with mock.patch("django_milvus.utils.delete_entries", failing):
+            with self.assertLogs("django_milvus", "ERROR"):
+                with self.captureOnCommitCallbacks(execute=True):
+                    product.delete()
+                with self.captureOnCommitCallbacks(execute=True):
+                    Product.objects.all().delete()
+        self.assertEqual(2, failing.call_count)
+        self.assertFalse(Product.objects.exists())
+
+    def test_bulk_create_ignoring_conflicts_is_mirrored(self):
+        rebuild_index(Product)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.bulk_create(
+                [Product(similarity=[6, 6])], ignore_conflicts=True
+            )
+        actual = Product.objects.filter(similarity__nearest_1=[6, 6]).first()
+        self.assertEqual([6, 6], actual.similarity)
+
+    def test_incremental_rebuild_index(self):
+        products = [Product.objects.create(similarity=[i, i]) for i in range(5)]
+        rebuild_index(Product, batch_size=2)
+        counts = rebuild_index(Product, batch_size=2, incremental=True)
+        self.assertEqual(
+            {"inserted": 0, "deleted": 0, "unchanged": 5, "rejected": 0},
+            counts["default"],
+        )
+        # Not mirrored to milvus, since the transaction does not commit.
+        Product.objects.filter(pk=products[0].pk).update(similarity=[80, 80])
+        products[1].delete()
+        counts = rebuild_index(Product, batch_size=2, incremental=True)
+        self.assertEqual(
+            {"inserted": 1, "deleted": 1, "unchanged": 3, "rejected": 0},
+            counts["default"],
+        )
+        actual = Product.objects.filter(similarity__nearest_1=[80, 80]).first()
+        self.assertEqual(products[0], actual)
+
+    def test_incremental_rebuild_index_moves_partitions(self):
+        product = CategorizedProduct.objects.create(category="a", similarity=[1, 1])
+        rebuild_index(CategorizedProduct)
+        # Not mirrored to milvus, since the transaction does not commit.
+        CategorizedProduct.objects.filter(pk=product.pk).update(category="b")
+        counts = rebuild_index(CategorizedProduct, incremental=True)
+        self.assertEqual(
+            {"inserted": 1, "deleted": 0, "unchanged": 0, "rejected": 0},
+            counts["default"],
+        )
+        actual = CategorizedProduct.objects.filter(
+            category="b", similarity__nearest_1=[1, 1]
+        ).first()
+        self.assertEqual(product, actual)
+        actual = CategorizedProduct.objects.filter(
+            category="a", similarity__nearest_1=[1, 1]
+        ).first()
+        self.assertIsNone(actual)
+
+    def test_shadow_rebuild_index(self):
+        product = Product.objects.create(similarity=[3, 3])
+        rebuild_index(Product)
+        rebuild_index(Product, shadow=True)
+        rebuild_index(Product, shadow=True)
+        conn = connections["default"]
+        self.assertTrue(conn.is_alias(Product))
+        self.assertEqual(1, len(conn.list_collection_versions(Product)))
+        actual = Product.objects.filter(similarity__nearest_1=[3, 3]).first()
+        self.assertEqual(product, actual)
+
+    def test_shadow_rebuild_keeps_concurrent_writes(self):
+        product = Product.objects.create(similarity=[3, 3])
+        Product.objects.create(similarity=[50, 50])
+        rebuild_index(Product)
+        conn = connections["default"]
+        bulk_insert_entries = conn.bulk_insert_entries
+
+        def insert_then_write(*args, **kwargs):
+            count = bulk_insert_entries(*args, **kwargs)
+            # Saved while the new version is being filled, so written to the
+            # current one.
+            product.similarity = [60, 60]
+            product.save()
+            update_entry(product)
+            return count
+
+        with mock.patch.object(conn, "bulk_insert_entries", insert_then_write):
+            rebuild_index(Product, shadow=True)
+        actual = Product.objects.filter(similarity__nearest_1=[60, 60]).first()
+        self.assertEqual(product, actual)
+        self.assertEqual(1, len(conn.list_collection_versions(Product)))
+
+    def test_pk_slices(self):
+        products = [Product.objects.create(similarity=[i, i]) for i in range(5)]
+        slices = get_pk_slices(Product.objects.all(), 2)
+        self.assertEqual(3, len(slices))
+        sliced = [list(filter_pk_slice(Product.objects.all(), s)) for s in slices]
+        self.assertEqual([products[:2], products[2:4], products[4:]], sliced)
+
+    def test_parallel_insert_in_transaction(self):
+        for i in range(5):
+            Product.objects.create(similarity=[i, i])
+        rebuild_index(Product)
+        conn = connections["default"]
+        conn.remove_collection(Product)
+        conn.create_collection(Product)
+        # TestCase runs in a transaction, the workers wouldn't see the rows.
+        with self.assertLogs("django_milvus", "WARNING"):
+            inserted = parallel_bulk_insert_entries(
+                conn, Product.objects.all(), workers=2
+            )
+        self.assertEqual(5, inserted)
+
+    def test_shards_num(self):
+        databases = {"default": {**settings.MILVUS["DATABASES"]["default"]}}
+        databases["default"]["SHARDS_NUM"] = 4
+        with override_settings(MILVUS={**settings.MILVUS, "DATABASES": databases}):
+            self.assertEqual(4, connections["default"].get_shards_num())
+
+    def test_uuid_pk_strategy(self):
+        expected = "varchar" if SUPPORTS_VARCHAR else "uuid"
+        self.assertEqual(expected, get_milvus_options(ProductUUID).pk_strategy.name)
+        strategy = UUIDPkStrategy(ProductUUID._meta.pk)
+        # uuid1 values of the same host only differ in their upper bits.
+        pks = [uuid1() for _ in range(100)] + [UUID(int=0), UUID(int=(1 << 128) - 1)]
+        ids, *extra = strategy.encode(pks)
+        self.assertEqual(len(pks), len(set(ids.tolist())))
+        self.assertEqual(pks, strategy.decode(ids, extra))
+
+    def test_invalid_vectors_are_rejected(self):
+        product = Product.objects.create(similarity=[5, 5])
+        empty = Product.objects.create(similarity=[])
+        with collect_rejected_rows() as rejected:
+            counts = rebuild_index(Product)
+        self.assertEqual({"inserted": 1, "rejected": 1}, counts["default"])
+        self.assertEqual([empty.pk], list(rejected[Product]))
+        actual = Product.objects.filter(similarity__nearest_1=[5, 5]).first()
+        self.assertEqual(product, actual)
+
+    def test_insert_errors_are_not_bisected(self):
+        class UnavailableCollection:
+            calls = 0
+
+            def insert(self, data, partition_name=None):
+                self.calls += 1
+                raise ConnectionError("milvus is down")
+
+        conn = connections["default"]
+        fields = conn.get_sorted_model_fields(Product)
+        vectors = [[[0] * f.dim] * 8 for f in fields]
+        columns = conn.get_milvus_columns(Product, range(8), vectors)
+        collection = UnavailableCollection()
+        with self.assertRaises(ConnectionError):
+            conn.insert_or_bisect(collection, Product, columns)
+        self.assertEqual(1, collection.calls)
+
+    def test_only_connection_errors_retry_searches(self):
+        class FailingCollection:
+            calls = 0
+
+            def __init__(self, error):
+                self.error = error
+
+            def search(self, **kwargs):
+                self.calls += 1
+                raise self.error
+
+        rebuild_index(Product)
+        conn = connections["default"]
+        field = Product._meta.get_field("similarity")
+        for error, calls in [(ValueError("bad vector"), 1), (ConnectionError(), 2)]:
+            collection = FailingCollection(error)
+            with mock.patch.object(conn, "load_collection", return_value=collection):
+                with self.assertRaises(type(error)):
+                    conn.search_candidates(Product, field, [[0, 0]], 1)
+            self.assertEqual(calls, collection.calls)
+
+    def test_numpy_backend(self):
+        products = [Product.objects.create(similarity=[i, i]) for i in range(10)]
+        path = tempfile.mkdtemp()
+        databases = {"default": {"BACKEND": "numpy", "PATH": path}}
+        connections.close_all()
+        reset_databases()
+        self.addCleanup(connections.close_all)
+        self.addCleanup(reset_databases)
+        with override_settings(MILVUS={**settings.MILVUS, "DATABASES": databases}):
+            rebuild_index(Product, shadow=True)
+            rebuild_index(Product, shadow=True)
+            connections["default"].flush(Product)
+            # Loaded from path by the next connection.
+            reset_databases()
+            connections.close_all()
+            actual = Product.objects.filter(similarity__nearest_3=[4.2, 4.2])
+            self.assertEqual(set(products[3:6]), set(actual))
+
+    async def test_await_milvus_future(self):
+        def insert_future(error_code: int) -> CollectionMutationFuture:
+            # What collection.insert(..., _async=True) returns, its grpc call
+            # completing later in another thread.
+            call: Future = Future()
+            response = milvus_pb2.MutationResult(
+                status=common_pb2.Status(error_code=error_code), insert_cnt=3
+            )
+            threading.Timer(0.05, call.set_result, [response]).start()
+            return CollectionMutationFuture(MutationFuture(call))
+
+        result = await await_milvus_future(insert_future(0))
+        self.assertEqual(3, result.insert_count)
+        # MilvusException with pymilvus 2.2, BaseException with 2.0.
+        with self.assertRaises(Exception) as error:
+            await await_milvus_future(insert_future(1))
+        self.assertEqual(1, error.exception.code)
@@ -1,10 +1,22 @@
 import random
 from typing import List
 
-from django.test import TestCase
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import TestCase, override_settings
+from pymilvus import DataType
 
-from django_milvus.utils import rebuild_index
-from django_milvus_tests.models import Product
+from django_milvus.fields import MilvusField
+from django_milvus.params import search_params
+from django_milvus.registry import connections
+from django_milvus.utils import rebuild_index, update_entry
+from django_milvus_tests.models import (
+    CategorizedProduct,
+    HashedProduct,
+    PackedProduct,
+    Product,
+)
 
 
 def random_vector(dim: int) -> List[int]:
@@ -34,3 +46,174 @@ class TestMilvusField(TestCase):
 
         actual = Product.objects.filter(similarity__nearest_1=[99, 99]).first()
         self.assertEqual(p2, actual)
+
+    def test_milvusfield_lookup_caches_load_state(self):
+        Product.objects.create(similarity=[0, 0])
+        rebuild_index(Product)
+        conn = connections["default"]
+        self.assertNotIn("product", conn.loaded_collections)
+        list(Product.objects.filter(similarity__nearest_1=[0, 0]))
+        self.assertIn("product", conn.loaded_collections)
+        rebuild_index(Product)
+        self.assertNotIn("product", conn.loaded_collections)
+
+    def test_nearest_is_ranked(self):
+        far = Product.objects.create(similarity=[50, 50])
+        near = Product.objects.create(similarity=[1, 1])
+        nearest = Product.objects.create(similarity=[0, 0])
+        rebuild_index(Product)
+
+        actual = list(Product.objects.nearest("similarity", [0, 0], 3))
+        self.assertEqual([nearest, near, far], actual)
+        self.assertEqual([0, 1, 2], [p.nearest_rank for p in actual])
+        self.assertLessEqual(actual[0].distance, actual[1].distance)
+        self.assertLessEqual(actual[1].distance, actual[2].distance)
+
+    def test_nearest_many(self):
+        p1 = Product.objects.create(similarity=[0, 0])
+        p2 = Product.objects.create(similarity=[50, 50])
+        rebuild_index(Product)
+
+        actual = Product.objects.nearest_many(
+            "similarity", [[1, 1], [49, 49], [60, 60]], 2, batch_size=2
+        )
+        self.assertEqual({0: [p1, p2], 1: [p2, p1], 2: [p2, p1]}, actual)
+
+    async def test_anearest(self):
+        p1 = await sync_to_async(Product.objects.create)(similarity=[0, 0])
+        await sync_to_async(rebuild_index)(Product)
+
+        actual = await Product.objects.anearest("similarity", [1, 1], 1)
+        self.assertEqual([p1], actual)
+
+    async def test_anearest_rechecks_filters(self):
+        p1 = await sync_to_async(Product.objects.create)(similarity=[0, 0])
+        p2 = await sync_to_async(Product.objects.create)(similarity=[50, 50])
+        await sync_to_async(rebuild_index)(Product)
+
+        queryset = Product.objects.search_params(adaptive=True).exclude(pk=p1.pk)
+        actual = await queryset.anearest("similarity", [1, 1], 1)
+        self.assertEqual([p2], actual)
+
+    def test_search_cache_is_invalidated_by_writes(self):
+        cached = {**settings.MILVUS, "SEARCH_CACHE": {"BACKEND": "lru", "TTL": 60}}
+        with override_settings(MILVUS=cached):
+            p1 = Product.objects.create(similarity=[0, 0])
+            rebuild_index(Product)
+            actual = Product.objects.filter(similarity__nearest_1=[1, 1]).first()
+            self.assertEqual(p1, actual)
+
+            p2 = Product.objects.create(similarity=[1, 1])
+            update_entry(p2)
+            actual = Product.objects.filter(similarity__nearest_1=[1, 1]).first()
+            self.assertEqual(p2, actual)
+
+    def test_search_params_override(self):
+        p1 = Product.objects.create(similarity=[0, 0])
+        p2 = Product.objects.create(similarity=[50, 50])
+        rebuild_index(Product)
+
+        overfetched = Product.objects.search_params(nprobe=1, overfetch=2)
+        actual = overfetched.filter(similarity__nearest_1=[1, 1])
+        self.assertEqual([p1], list(actual))
+        # The candidates beyond k are only used when the filters leave out
+        # some of the k nearest.
+        actual = overfetched.exclude(pk=p1.pk).filter(similarity__nearest_1=[1, 1])
+        self.assertEqual([p2], list(actual))
+        with search_params(nprobe=1):
+            actual = Product.objects.filter(similarity__nearest_1=[1, 1])
+            self.assertEqual([p1], list(actual))
+        with self.assertRaises(ValueError):
+            Product.objects.search_params(nlist=1)
+
+    def test_index_params(self):
+        field = MilvusField(
+            dim=16,
+            dtype=DataType.FLOAT_VECTOR,
+            index_type="HNSW",
+            index_params={"M": 32},
+            search_params={"ef": 128},
+        )
+        field.set_attributes_from_name("vector")
+        self.assertEqual({"M": 32, "efConstruction": 200}, field.get_index_params())
+        self.assertEqual({"ef": 128}, field.get_search_params())
+        self.assertEqual({"ef": 16}, field.get_search_params({"ef": 16, "nprobe": 1}))
+        self.assertEqual([], field.check())
+
+        field = MilvusField(
+            dim=16,
+            dtype=DataType.FLOAT_VECTOR,
+            index_type="IVF_PQ",
+            index_params={"m": 5},
+        )
+        field.set_attributes_from_name("vector")
+        self.assertEqual(["django_milvus.E001"], [e.id for e in field.check()])
+
+    def test_partitioned_search(self):
+        a = CategorizedProduct.objects.create(category="a", similarity=[0, 0])
+        CategorizedProduct.objects.create(category="b", similarity=[10, 10])
+        rebuild_index(CategorizedProduct)
+        actual = CategorizedProduct.objects.filter(
+            category="a", similarity__nearest_1=[10, 10]
+        )
+        self.assertEqual([a], list(actual))
+        actual = CategorizedProduct.objects.filter(
+            category="c", similarity__nearest_1=[10, 10]
+        )
+        self.assertEqual([], list(actual))
+
+    def test_filters_are_pushed_down(self):
+        cheap = CategorizedProduct.objects.create(
+            category="a", price=5, similarity=[0, 0]
+        )
+        CategorizedProduct.objects.create(category="a", price=50, similarity=[9, 9])
+        rebuild_index(CategorizedProduct)
+        actual = CategorizedProduct.objects.filter(
+            price__lt=10, similarity__nearest_1=[9, 9]
+        )
+        self.assertEqual([cheap], list(actual))
+
+    def test_integer_filters_are_rounded_like_django(self):
+        product = CategorizedProduct.objects.create(
+            category="a", stock=1, similarity=[0, 0]
+        )
+        rebuild_index(CategorizedProduct)
+        actual = CategorizedProduct.objects.filter(
+            stock__lt=1.5, similarity__nearest_1=[0, 0]
+        )
+        self.assertEqual([product], list(actual))
+
+    def test_adaptive_search(self):
+        for i in range(10):
+            CategorizedProduct.objects.create(category="b", similarity=[i, i])
+        far = CategorizedProduct.objects.create(category="a", similarity=[90, 90])
+        rebuild_index(CategorizedProduct)
+        queryset = CategorizedProduct.objects.filter(category__startswith="a")
+        self.assertEqual([], list(queryset.filter(similarity__nearest_1=[0, 0])))
+        queryset = queryset.search_params(adaptive=True).filter(
+            similarity__nearest_1=[0, 0]
+        )
+        self.assertEqual([far], list(queryset))
+        self.assertEqual(3, queryset.milvus_search_rounds[0])
+
+    def test_packed_storage(self):
+        product = PackedProduct.objects.create(similarity=[1.5, 2])
+        product.refresh_from_db()
+        self.assertIsInstance(product.similarity, np.ndarray)
+        self.assertEqual([1.5, 2], product.similarity.tolist())
+        self.assertFalse(product.similarity.flags.writeable)
+        rebuild_index(PackedProduct)
+        actual = PackedProduct.objects.filter(similarity__nearest_1=[1, 2]).first()
+        self.assertEqual(product, actual)
+
+    def test_binary_vectors(self):
+        bits = [1] * 8 + [0] * 8
+        product = HashedProduct.objects.create(similarity=bits)
+        HashedProduct.objects.create(similarity=[0] * 8 + [1] * 8)
+        product.refresh_from_db()
+        self.assertEqual(b"\xff\x00", product.similarity.tobytes())
+        rebuild_index(HashedProduct)
+        actual = HashedProduct.objects.filter(similarity__nearest_1=bits).first()
+        self.assertEqual(product, actual)
+        actual = HashedProduct.objects.filter(similarity__nearest_1=b"\xfe\x00")
+        self.assertEqual([product], list(actual))